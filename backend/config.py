@@ -2,54 +2,74 @@
 Configuration management for the Botco Data Platform.
 """
 import os
+from functools import lru_cache
 from typing import Optional
 from pydantic import Field
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     """Application settings with environment variable support."""
     
+    # Fields map to their upper-cased names (APP_NAME, AWS_REGION, ...)
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False, extra="ignore")
+    
     # Application
-    app_name: str = Field(default="Botco Data Platform", env="APP_NAME")
-    app_version: str = Field(default="1.0.0", env="APP_VERSION")
-    debug: bool = Field(default=False, env="DEBUG")
+    app_name: str = Field(default="Botco Data Platform")
+    app_version: str = Field(default="1.0.0")
+    debug: bool = Field(default=False)
     
     # Server
-    host: str = Field(default="0.0.0.0", env="HOST")
-    port: int = Field(default=8000, env="PORT")
+    host: str = Field(default="0.0.0.0")
+    port: int = Field(default=8000)
     
     # CORS
-    cors_origins: list = Field(default=["http://localhost:3000"], env="CORS_ORIGINS")
+    cors_origins: list = Field(default=["http://localhost:3000"])
     
     # Data paths
-    data_dir: str = Field(default="data", env="DATA_DIR")
-    videos_dir: str = Field(default="data/videos", env="VIDEOS_DIR")
-    visualizations_dir: str = Field(default="data/visualizations", env="VISUALIZATIONS_DIR")
+    data_dir: str = Field(default="data")
+    videos_dir: str = Field(default="data/videos")
+    visualizations_dir: str = Field(default="data/visualizations")
+    
+    # Video serving: open-ended Range requests are answered in spans of at most this size
+    video_range_max_bytes: int = Field(default=4 * 1024 * 1024)
     
     # SAM2 AI
-    sam2_model_name: str = Field(default="facebook/sam2-hiera-tiny", env="SAM2_MODEL_NAME")
-    sam2_device: str = Field(default="auto", env="SAM2_DEVICE")  # auto, cpu, cuda
+    sam2_model_name: str = Field(default="facebook/sam2-hiera-tiny")
+    sam2_device: str = Field(default="auto")  # auto, cpu, cuda, mps
+    # int8 (float8 on Ada/Hopper) dynamic quantization of the image encoder (CUDA, needs torchao)
+    sam2_quantize: bool = Field(default=False)
+    # 2:4 magnitude pruning of the mask decoder's linear layers (Ampere+, lossy without fine-tuning)
+    sam2_sparsify_decoder: bool = Field(default=False)
+    # Automatic mask generator settings: "quality" (32x32 points over two crop layers) or "fast" (16x16, no crops)
+    sam2_quality_profile: str = Field(default="quality")
     
     # Task management
-    task_timeout: float = Field(default=20.0, env="TASK_TIMEOUT")
-    max_workers: int = Field(default=4, env="MAX_WORKERS")
+    task_timeout: float = Field(default=20.0)
+    max_workers: int = Field(default=4)
+    task_db_path: str = Field(default="data/tasks.db")
+    # Finished tasks, and their stored results, are deleted after this many hours
+    task_retention_hours: int = Field(default=24)
+    task_cleanup_interval: float = Field(default=3600.0)  # seconds between cleanups
     
     # AWS S3 (for future cloud storage)
-    aws_access_key_id: Optional[str] = Field(default=None, env="AWS_ACCESS_KEY_ID")
-    aws_secret_access_key: Optional[str] = Field(default=None, env="AWS_SECRET_ACCESS_KEY")
-    aws_region: str = Field(default="us-east-1", env="AWS_REGION")
-    s3_bucket_name: Optional[str] = Field(default=None, env="S3_BUCKET_NAME")
-    s3_videos_prefix: str = Field(default="videos/", env="S3_VIDEOS_PREFIX")
-    s3_visualizations_prefix: str = Field(default="visualizations/", env="S3_VISUALIZATIONS_PREFIX")
+    aws_access_key_id: Optional[str] = Field(default=None)
+    aws_secret_access_key: Optional[str] = Field(default=None)
+    aws_region: str = Field(default="us-east-1")
+    s3_bucket_name: Optional[str] = Field(default=None)
+    s3_videos_prefix: str = Field(default="videos/")
+    s3_visualizations_prefix: str = Field(default="visualizations/")
+    s3_max_pool_connections: int = Field(default=20)
     
     # Storage mode (local or s3)
-    storage_mode: str = Field(default="local", env="STORAGE_MODE")  # local, s3
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+    storage_mode: str = Field(default="local")  # local, s3
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings, parsing the environment and .env once."""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
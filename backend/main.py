@@ -3,28 +3,55 @@ Botco Data Platform - Main Application
 
 A professional robotics data visualization platform with AI-powered segmentation.
 """
+import asyncio
 import os
+import stat
 import time
 from contextlib import asynccontextmanager
-from typing import Dict, Any
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, Response
 import mimetypes
+import orjson
 
 from config import settings
 from utils.logging import logger
-from exceptions import BotcoException, FileNotFoundError, ServiceUnavailableError
-from models import APIResponse, HealthCheck, ProcessVideoRequest, TaskInfo
-from services.storage_service import storage_manager
+from utils.compression import APIGZipMiddleware
+from utils.file_response import RangeFileResponse, file_validators, is_not_modified
+from utils.responses import cached_json_response, payload_etag
+from exceptions import BotcoException
+from models import HealthCheck
 from services.task_manager import task_manager
 from services.sam2_service import sam2_service
 from services.scenario_service import scenario_service
 from routes import api_router
 
 
+async def _scan_video_directory():
+    """Run the initial video directory scan and cache warm-up off the event loop."""
+    try:
+        scenarios = await run_in_threadpool(scenario_service.warmup)
+        logger.info(f"Found {len(scenarios)} scenarios with {sum(s.total_episodes for s in scenarios)} total episodes")
+    except Exception as e:
+        # Lookups rescan on demand, so a failed warm-up is not fatal
+        logger.error(f"Failed to scan video directory: {e}")
+
+
+async def _cleanup_tasks_periodically():
+    """Delete expired finished tasks, from memory and the task database, at a fixed interval."""
+    while True:
+        await asyncio.sleep(settings.task_cleanup_interval)
+        try:
+            await run_in_threadpool(task_manager.cleanup_old_tasks, settings.task_retention_hours)
+        except Exception as e:
+            logger.error(f"Failed to clean up old tasks: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
@@ -43,13 +70,14 @@ async def lifespan(app: FastAPI):
         logger.warning(f"SAM2 service initialization failed (optional): {e}")
         logger.info("Continuing without SAM2 service - AI features will be disabled")
     
-    try:
-        logger.info("Scanning video directory...")
-        scenarios = scenario_service.scan_video_directory()
-        logger.info(f"Found {len(scenarios)} scenarios with {sum(s.total_episodes for s in scenarios)} total episodes")
-    except Exception as e:
-        logger.error(f"Failed to scan video directory: {e}")
-        raise ServiceUnavailableError("Video directory scanning failed")
+    # Scan in the background so the server accepts requests (and reports
+    # "warming" on /health) while large video trees are walked
+    logger.info("Scanning video directory in the background...")
+    app.state.scan_task = asyncio.create_task(_scan_video_directory())
+    
+    # Expire tasks left from earlier runs now, then keep the task database bounded
+    await run_in_threadpool(task_manager.cleanup_old_tasks, settings.task_retention_hours)
+    app.state.cleanup_task = asyncio.create_task(_cleanup_tasks_periodically())
     
     logger.info("Botco Data Platform started successfully")
     
@@ -57,6 +85,9 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Botco Data Platform...")
+    if not app.state.scan_task.done():
+        app.state.scan_task.cancel()
+    app.state.cleanup_task.cancel()
     task_manager.shutdown()
     logger.info("Shutdown complete")
 
@@ -67,17 +98,21 @@ app = FastAPI(
     version=settings.app_version,
     description="A professional robotics data visualization platform with AI-powered segmentation",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.debug else None,
     redoc_url="/redoc" if settings.debug else None
 )
 
-# Configure CORS
+# Compress JSON responses (task results carry large mask payloads)
+app.add_middleware(APIGZipMiddleware, minimum_size=512, compresslevel=4)
+
+# Configure CORS with explicit lists so preflight checks are plain set lookups
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "HEAD", "OPTIONS"],
+    allow_headers=["Content-Type", "Range", "If-None-Match", "If-Modified-Since"],
 )
 
 
@@ -86,7 +121,7 @@ app.add_middleware(
 async def botco_exception_handler(request: Request, exc: BotcoException):
     """Handle custom Botco exceptions."""
     logger.error(f"Botco exception: {exc.message} (Code: {exc.error_code})")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
@@ -101,7 +136,7 @@ async def botco_exception_handler(request: Request, exc: BotcoException):
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions."""
     logger.error(f"HTTP exception: {exc.detail} (Status: {exc.status_code})")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
@@ -111,79 +146,188 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     )
 
 
+# The generic 500 body never varies, so encode it once
+_INTERNAL_ERROR_BODY = orjson.dumps({
+    "success": False,
+    "message": "An unexpected error occurred",
+    "error": "INTERNAL_ERROR"
+})
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions."""
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
-        status_code=500,
-        content={
-            "success": False,
-            "message": "An unexpected error occurred",
-            "error": "INTERNAL_ERROR"
-        }
-    )
+    return Response(content=_INTERNAL_ERROR_BODY, status_code=500, media_type="application/json")
+
+
+# Resolved once at import so static requests only pay for the file stat
+_DATA_ROOT = os.path.realpath(settings.data_dir)
+_DATA_ROOT_PREFIX = _DATA_ROOT + os.sep
+
+# Parse the system mime.types now rather than on the first static request
+mimetypes.init()
+
+_VIDEO_EXTS = frozenset({".mp4", ".avi", ".mov", ".mkv"})
+
+# Encoded once; appended to each video response's raw header list as-is
+_VIDEO_HEADERS = (
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, HEAD, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+    (b"cache-control", b"public, max-age=3600"),
+)
+
+
+# Content types for the extensions this app actually serves; anything else is
+# resolved through mimetypes once and remembered here
+_EXT_CONTENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".mkv": "video/x-matroska",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".json": "application/json",
+    ".js": "text/javascript",
+    ".css": "text/css",
+    ".html": "text/html",
+}
+
+
+def _mime_for(ext: str) -> str:
+    """Resolve the content type for a lower-cased file extension."""
+    content_type = _EXT_CONTENT_TYPES.get(ext)
+    if content_type is None:
+        content_type = mimetypes.guess_type("x" + ext)[0] or "application/octet-stream"
+        _EXT_CONTENT_TYPES[ext] = content_type
+    return content_type
+
+
+def _resolve_static_path(path: str) -> Optional[str]:
+    """Resolve a request path under the data root, or None if it escapes it.
+    
+    realpath also follows symlinks, so links pointing outside the data root
+    are rejected. It is resolved on every request: a symlink swapped after a
+    cached check would otherwise still be served.
+    """
+    file_path = os.path.realpath(os.path.join(_DATA_ROOT, path))
+    return file_path if file_path.startswith(_DATA_ROOT_PREFIX) else None
+
+
+# Small non-video assets (visualization frames, thumbnails) are kept in memory
+_SMALL_FILE_LIMIT = 512 * 1024
+
+
+@lru_cache(maxsize=128)
+def _read_small_file(file_path: str, mtime_ns: int, size: int) -> bytes:
+    """Read a small static file. Keyed on mtime and size so a changed file misses."""
+    with open(file_path, "rb") as f:
+        return f.read()
 
 
 # Static file serving with proper headers
 @app.get("/static/{path:path}")
-async def serve_static_file(path: str):
-    """Serve static files with proper headers."""
-    file_path = os.path.join(settings.data_dir, path)
+async def serve_static_file(path: str, request: Request):
+    """Serve static files with proper headers and byte-range support."""
+    # realpath walks every path component, so keep it off the loop too
+    file_path = await run_in_threadpool(_resolve_static_path, path)
+    if file_path is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    # stat can block on network mounts or cold metadata, so keep it off the loop
+    try:
+        stat_result = await run_in_threadpool(os.stat, file_path)
+    except OSError:
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail=f"File not found: {path}")
     
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {path}")
+    # Repeat hits from the player and the visualization viewer need no body
+    validators = file_validators(stat_result)
+    if is_not_modified(request.headers, validators, stat_result.st_mtime):
+        return Response(status_code=304, headers=validators)
     
     # Determine content type
-    content_type, _ = mimetypes.guess_type(file_path)
-    if not content_type:
-        content_type = "application/octet-stream"
+    content_type = _mime_for(os.path.splitext(file_path)[1].lower())
+    
+    range_header = request.headers.get("range")
     
     # Special handling for video files
     if content_type.startswith("video/"):
-        return FileResponse(
+        return RangeFileResponse(
             file_path,
+            range_header,
+            stat_result=stat_result,
+            max_range_bytes=settings.video_range_max_bytes,
+            media_type=content_type,
+            raw_headers=_VIDEO_HEADERS
+        )
+    
+    if range_header is None and stat_result.st_size <= _SMALL_FILE_LIMIT:
+        content = await run_in_threadpool(_read_small_file, file_path, stat_result.st_mtime_ns, stat_result.st_size)
+        return Response(
+            content=content,
             media_type=content_type,
-            headers={
-                "Accept-Ranges": "bytes",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-                "Cache-Control": "public, max-age=3600"
-            }
+            headers=validators
         )
-    else:
-        return FileResponse(file_path, media_type=content_type)
+    
+    return RangeFileResponse(file_path, range_header, stat_result=stat_result, media_type=content_type)
+
+
+# Probes hit /health several times a second, so the body is a reused dict
+# encoded straight to bytes rather than a validated HealthCheck model
+_HEALTH_BODY = {
+    "status": "healthy",
+    "timestamp": None,
+    "version": settings.app_version,
+    "uptime": 0.0
+}
 
 
 # Health check endpoint
 @app.get("/health", response_model=HealthCheck)
 async def health_check():
     """Health check endpoint."""
-    return HealthCheck(
-        status="healthy",
-        timestamp=time.time(),
-        version=settings.app_version,
-        uptime=time.time() - start_time
-    )
+    now = time.time()
+    scan_task = getattr(app.state, "scan_task", None)
+    _HEALTH_BODY["status"] = "warming" if scan_task is not None and not scan_task.done() else "healthy"
+    _HEALTH_BODY["timestamp"] = datetime.fromtimestamp(now, timezone.utc)
+    _HEALTH_BODY["uptime"] = now - start_time
+    return Response(content=orjson.dumps(_HEALTH_BODY, option=orjson.OPT_UTC_Z), media_type="application/json")
 
 
-# Include API routes
-from routes.scenarios import router as scenarios_router
+# Include API routes; routes.api_router mounts scenarios and AI exactly once
 app.include_router(api_router, prefix="/api/v1")
-app.include_router(scenarios_router, prefix="/api/v1")
 
 # AI Processing endpoints are now handled by the AI router
 
-# Legacy endpoints for frontend compatibility
+# Legacy endpoints for frontend compatibility. They return encoded responses
+# directly: the payloads are plain str/int containers, so FastAPI's
+# jsonable_encoder pass over every value can be skipped. Listings that only
+# change on a rescan are encoded once and revalidated by ETag.
+
+# (scenario id array it was built from, encoded payload, etag)
+_scenarios_payload: Optional[Tuple[bytes, bytes, str]] = None
+
+
 @app.get("/scenarios-list")
-async def legacy_scenarios_list():
+async def legacy_scenarios_list(request: Request):
     """Legacy endpoint for scenarios list."""
+    global _scenarios_payload
     try:
-        scenarios = scenario_service.get_scenarios()
-        return {
-            "scenarios": [scenario.id for scenario in scenarios]
-        }
+        # Wait for the startup scan rather than starting a second walk
+        scan_task = getattr(app.state, "scan_task", None)
+        if scan_task is not None:
+            await asyncio.shield(scan_task)
+        scenario_ids = await run_in_threadpool(scenario_service.get_scenario_ids_json)
+        if _scenarios_payload is None or _scenarios_payload[0] is not scenario_ids:
+            body = b'{"scenarios":' + scenario_ids + b'}'
+            _scenarios_payload = (scenario_ids, body, payload_etag(body))
+        return cached_json_response(request, _scenarios_payload[1], _scenarios_payload[2])
     except Exception as e:
         logger.error(f"Failed to get scenarios: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -193,20 +337,30 @@ async def test_endpoint():
     """Test endpoint."""
     return {"message": "Test endpoint working"}
 
+# scenario_id -> (scenes list it was encoded from, encoded payload, etag). The
+# service returns the same list object until the scenario changes on disk.
+_scene_payloads: Dict[str, Tuple[list, bytes, str]] = {}
+
+
 @app.get("/scenarios/{scenario_id}/scenes")
-async def legacy_scenes_list(scenario_id: str):
+async def legacy_scenes_list(scenario_id: str, request: Request):
     """Legacy endpoint for scenes list."""
     try:
-        scenes = scenario_service.get_scenes(scenario_id)
-        return {
-            "scenes": [scene.id for scene in scenes],
-            "scene_details": [{
-                "id": scene.id,
-                "name": scene.name,
-                "description": scene.description,
-                "episode_count": scene.episode_count
-            } for scene in scenes]
-        }
+        scenes = await run_in_threadpool(scenario_service.get_scenes, scenario_id)
+        cached = _scene_payloads.get(scenario_id)
+        if cached is None or cached[0] is not scenes:
+            body = orjson.dumps({
+                "scenes": [scene.id for scene in scenes],
+                "scene_details": [{
+                    "id": scene.id,
+                    "name": scene.name,
+                    "description": scene.description,
+                    "episode_count": scene.episode_count
+                } for scene in scenes]
+            })
+            cached = (scenes, body, payload_etag(body))
+            _scene_payloads[scenario_id] = cached
+        return cached_json_response(request, cached[1], cached[2])
     except Exception as e:
         logger.error(f"Failed to get scenes for scenario {scenario_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -215,19 +369,21 @@ async def legacy_scenes_list(scenario_id: str):
 async def legacy_episodes_list(scenario_id: str, scene_id: str):
     """Legacy endpoint for episodes list."""
     try:
-        episodes = scenario_service.get_episodes(scenario_id, scene_id)
-        return {
+        episodes = await run_in_threadpool(scenario_service.get_episodes, scenario_id, scene_id)
+        return ORJSONResponse({
             "episodes": [episode.id for episode in episodes]
-        }
+        })
     except Exception as e:
         logger.error(f"Failed to get episodes for scene {scenario_id}/{scene_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/video/{path:path}")
-async def legacy_video_serve(path: str):
+async def legacy_video_serve(path: str, request: Request):
     """Legacy endpoint for video serving."""
+    if path[path.rfind("."):].lower() not in _VIDEO_EXTS:
+        raise HTTPException(status_code=404, detail=f"Video not found: {path}")
     video_path = f"videos/{path}"
-    return await serve_static_file(video_path)
+    return await serve_static_file(video_path, request)
 
 
 # Store start time for uptime calculation
@@ -235,13 +391,23 @@ start_time = time.time()
 
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
     
-    logger.info(f"Starting server on {settings.host}:{settings.port}")
+    # uvloop and httptools come with uvicorn[standard]; fall back to the pure
+    # Python loop and parser where they are unavailable (e.g. Windows)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    
+    logger.info(f"Starting server on {settings.host}:{settings.port} ({loop}, {http})")
+    # A single worker: tasks, their stream watchers and the response caches
+    # live in this process
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
+        loop=loop,
+        http=http,
         log_level="debug" if settings.debug else "info"
     )
\ No newline at end of file
@@ -30,11 +30,6 @@ class Scenario(BaseModel):
     total_scenes: int = Field(0, description="Total number of scenes")
     total_episodes: int = Field(0, description="Total number of episodes")
     created_at: Optional[datetime] = Field(None, description="Creation timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class Scene(BaseModel):
@@ -45,11 +40,6 @@ class Scene(BaseModel):
     episode_count: int = Field(0, description="Number of episodes in this scene")
     description: str = Field("", description="Physical task description for this scene")
     created_at: Optional[datetime] = Field(None, description="Creation timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class Episode(BaseModel):
@@ -66,11 +56,6 @@ class Episode(BaseModel):
     fps: Optional[float] = Field(None, description="Frames per second")
     file_size: Optional[int] = Field(None, description="File size in bytes")
     created_at: Optional[datetime] = Field(None, description="Creation timestamp")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class PromptPoint(BaseModel):
@@ -96,9 +81,15 @@ class ProcessVideoRequest(BaseModel):
         use_enum_values = True
 
 
+class RLEMask(BaseModel):
+    """Segmentation mask in uncompressed COCO run-length encoding."""
+    size: List[int] = Field(..., description="Mask size [height, width]")
+    counts: List[int] = Field(..., description="Alternating 0/1 run lengths in column-major order, starting with 0s")
+
+
 class MaskData(BaseModel):
     """Mask data from SAM2 processing."""
-    segmentation: List[List[bool]] = Field(..., description="Segmentation mask as 2D boolean array")
+    segmentation: RLEMask = Field(..., description="Run-length encoded segmentation mask")
     area: int = Field(..., description="Area of the mask in pixels")
     bbox: List[float] = Field(..., description="Bounding box [x, y, width, height]")
     predicted_iou: float = Field(..., description="Predicted IoU score")
@@ -118,7 +109,7 @@ class SegmentationResult(BaseModel):
 class ObjectTracking(BaseModel):
     """Object tracking information."""
     first_frame: int = Field(..., description="First frame where object appears")
-    initial_mask: List[List[bool]] = Field(..., description="Initial mask for the object")
+    initial_mask: Optional[RLEMask] = Field(None, description="Run-length encoded initial mask for the object")
 
 
 class ProcessingResult(BaseModel):
@@ -156,9 +147,6 @@ class TaskInfo(BaseModel):
     
     class Config:
         use_enum_values = True
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class APIResponse(BaseModel):
@@ -175,8 +163,3 @@ class HealthCheck(BaseModel):
     timestamp: datetime = Field(..., description="Check timestamp")
     version: str = Field(..., description="Application version")
     uptime: Optional[float] = Field(None, description="Service uptime in seconds")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
\ No newline at end of file
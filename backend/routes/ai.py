@@ -1,16 +1,27 @@
 """
 AI processing API routes.
 """
+import asyncio
+
+import orjson
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from typing import Dict, Any
 
 from models import ProcessVideoRequest, TaskInfo, APIResponse, TaskStatus
 from services.sam2_service import sam2_service
-from services.task_manager import task_manager
+from services.task_manager import task_manager, TERMINAL_STATUSES
 from utils.logging import logger
+from utils.responses import model_response
+from sam2visualizations import create_simple_visualization
 
 router = APIRouter()
 
+# APIResponse envelope around a task serialized by model_dump_json
+_TASK_STATUS_PREFIX = b'{"success":true,"message":"Task status retrieved","data":'
+_TASK_STATUS_SUFFIX = b',"error":null}'
+
 
 @router.post("/process-video", response_model=APIResponse)
 async def process_video(request: ProcessVideoRequest, background_tasks: BackgroundTasks):
@@ -28,11 +39,11 @@ async def process_video(request: ProcessVideoRequest, background_tasks: Backgrou
             request.mode
         )
         
-        return APIResponse(
+        return model_response(APIResponse(
             success=True,
             message="Video processing started",
             data={"task_id": task_id}
-        )
+        ))
         
     except Exception as e:
         logger.error(f"Failed to start video processing: {e}")
@@ -47,27 +58,19 @@ async def _process_video_task(task_id: str, video_path: str, prompts: list, mode
         # Process video with SAM2
         result = await sam2_service.process_video(video_path, prompts, mode, task_id)
         
-        # Log the complete result for debugging
-        logger.info(f"SAM2 processing result for task {task_id}:")
-        
-        # Convert to dict for easier inspection
+        visualization_path = getattr(result, 'visualization_path', None)
         result_dict = result.model_dump() if hasattr(result, 'model_dump') else result
-        logger.info(f"Result dict keys: {list(result_dict.keys()) if isinstance(result_dict, dict) else 'Not a dict'}")
-        
-        # Log visualization path if available
-        visualization_path = None
-        if hasattr(result, 'visualization_path') and result.visualization_path:
-            visualization_path = result.visualization_path
-            logger.info(f"Visualization path for task {task_id}: {visualization_path}")
-        elif isinstance(result_dict, dict) and 'visualization_path' in result_dict:
-            visualization_path = result_dict['visualization_path']
-            logger.info(f"Visualization path for task {task_id}: {visualization_path}")
-        else:
-            logger.info(f"No visualization_path found in result for task {task_id}")
-            logger.info(f"Full result content: {result_dict}")
+        # The model and its dump each hold every frame's masks; only the dump
+        # is kept, so the task's peak memory is one copy of the result
+        del result
+        
+        if not visualization_path and isinstance(result_dict, dict):
+            visualization_path = result_dict.get('visualization_path')
+        # Only the keys are logged: the result holds every frame's masks
+        logger.debug("Result keys for task %s: %s", task_id, result_dict.keys() if isinstance(result_dict, dict) else type(result_dict))
         
         task_manager.update_task_status(task_id, TaskStatus.COMPLETED, progress=1.0, result=result_dict)
-        logger.info(f"Video processing completed for task {task_id}")
+        logger.info(f"Video processing completed for task {task_id}, visualization path: {visualization_path}")
         
     except Exception as e:
         error_msg = str(e)
@@ -79,14 +82,18 @@ async def _process_video_task(task_id: str, video_path: str, prompts: list, mode
 async def get_task_status(task_id: str):
     """Get task status."""
     try:
-        task = task_manager.get_task(task_id)
-        if not task:
+        task_json = task_manager.peek_task_json(task_id)
+        if task_json is None:
+            # Encoding or loading from the database takes the task lock
+            task_json = await run_in_threadpool(task_manager.get_task_json, task_id)
+        if task_json is None:
             raise HTTPException(status_code=404, detail="Task not found")
         
-        return APIResponse(
-            success=True,
-            message="Task status retrieved",
-            data=task.model_dump()
+        # The task manager encodes a task once per change, so repeated polls
+        # only splice the cached bytes into the envelope
+        return Response(
+            content=_TASK_STATUS_PREFIX + task_json + _TASK_STATUS_SUFFIX,
+            media_type="application/json"
         )
         
     except HTTPException:
@@ -96,6 +103,45 @@ async def get_task_status(task_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/tasks/{task_id}/stream")
+async def stream_task_status(task_id: str):
+    """Stream task status as server-sent events until the task finishes."""
+    if not (task_manager.peek_task(task_id) or await run_in_threadpool(task_manager.get_task, task_id)):
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    async def events():
+        updated = task_manager.watch(task_id)
+        try:
+            while True:
+                # Clear before reading so an update landing in between still wakes us
+                updated.clear()
+                task = task_manager.peek_task(task_id)
+                task_json = task_manager.peek_task_json(task_id)
+                if task is None or task_json is None:
+                    # Not cached or not encoded yet; both may block on the task lock
+                    task = await run_in_threadpool(task_manager.get_task, task_id)
+                    task_json = await run_in_threadpool(task_manager.get_task_json, task_id)
+                if task is None or task_json is None:
+                    break
+                # Cached per task version, so every stream and poller shares one encoding
+                yield b"data: " + task_json + b"\n\n"
+                if task.status in TERMINAL_STATUSES:
+                    break
+                try:
+                    await asyncio.wait_for(updated.wait(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle stream
+                    yield b": keepalive\n\n"
+        finally:
+            task_manager.unwatch(task_id, updated)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/generate-visualization/{task_id}", response_model=APIResponse)
 async def generate_visualization(task_id: str, background_tasks: BackgroundTasks):
     """Generate visualization for a completed SAM2 task."""
@@ -118,11 +164,11 @@ async def generate_visualization(task_id: str, background_tasks: BackgroundTasks
             task.result
         )
         
-        return APIResponse(
+        return model_response(APIResponse(
             success=True,
             message="Visualization generation started",
             data={"task_id": viz_task_id}
-        )
+        ))
         
     except HTTPException:
         raise
@@ -136,11 +182,11 @@ async def _generate_visualization_task(viz_task_id: str, sam2_task_id: str, sam2
     try:
         task_manager.update_task_status(viz_task_id, TaskStatus.RUNNING, progress=0.1)
         
-        # Import visualization function
-        from sam2visualizations import create_simple_visualization
-        
-        # Generate visualization
-        viz_result = create_simple_visualization(sam2_task_id, sam2_result)
+        # Rendering decodes and re-encodes every frame; keep it off the event loop
+        loop = asyncio.get_running_loop()
+        viz_result = await loop.run_in_executor(
+            task_manager.executor, create_simple_visualization, sam2_task_id, sam2_result
+        )
         
         task_manager.update_task_status(viz_task_id, TaskStatus.COMPLETED, progress=1.0, result=viz_result)
         logger.info(f"Visualization generation completed for task {viz_task_id}")
@@ -155,11 +201,18 @@ async def _generate_visualization_task(viz_task_id: str, sam2_task_id: str, sam2
 async def get_all_tasks():
     """Get all tasks."""
     try:
-        tasks = task_manager.get_all_tasks()
-        return APIResponse(
-            success=True,
-            message=f"Found {len(tasks)} tasks",
-            data={task_id: task.model_dump() for task_id, task in tasks.items()}
+        # Tasks are encoded once per change by the task manager and spliced into
+        # the envelope; a rebuild reads the task database, so it runs off the loop
+        tasks = task_manager.peek_tasks_snapshot()
+        if tasks is None:
+            tasks = await run_in_threadpool(task_manager.get_tasks_snapshot)
+        data = b",".join(task_id + b":" + task_json for task_id, task_json in tasks)
+        return Response(
+            content=(
+                b'{"success":true,"message":' + orjson.dumps(f"Found {len(tasks)} tasks")
+                + b',"data":{' + data + b'},"error":null}'
+            ),
+            media_type="application/json"
         )
         
     except Exception as e:
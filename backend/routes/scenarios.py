@@ -1,37 +1,73 @@
 """
 Scenario-related API routes.
 """
-import math
-import random
-from typing import List
-from fastapi import APIRouter, HTTPException
+import asyncio
+import time
+from typing import Callable, Dict, Iterator, Tuple
+
+import numpy as np
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 
 from models import Scenario, Scene, Episode, APIResponse
 from services.scenario_service import scenario_service
 from utils.logging import logger
+from utils.responses import cached_json_response, payload_etag
 
 router = APIRouter()
 
+# Scenario data only changes when videos are added on disk, so encoded
+# responses are reused for a short TTL and revalidated by ETag
+RESPONSE_CACHE_TTL = 5.0
+# Browsers may reuse a listing briefly before revalidating it with If-None-Match
+RESPONSE_CACHE_CONTROL = "private, max-age=30"
+
+# (endpoint, *path params) -> (cached at, encoded APIResponse, etag)
+_response_cache: Dict[Tuple, Tuple[float, bytes, str]] = {}
+
+
+async def _cached_api_response(request: Request, key: Tuple, build: Callable[[], APIResponse]) -> Response:
+    """Serve an encoded APIResponse from the cache, rebuilding it once the TTL expires."""
+    now = time.monotonic()
+    entry = _response_cache.get(key)
+    if entry is None or now - entry[0] > RESPONSE_CACHE_TTL:
+        # Requests arriving during startup wait for the warm-up scan instead
+        # of each starting their own walk of the video tree
+        scan_task = getattr(request.app.state, "scan_task", None)
+        if scan_task is not None and not scan_task.done():
+            await asyncio.shield(scan_task)
+        # build walks the filesystem, so keep it off the event loop
+        response = await run_in_threadpool(build)
+        body = response.model_dump_json().encode()
+        entry = (now, body, payload_etag(body))
+        _response_cache[key] = entry
+    return cached_json_response(request, entry[1], entry[2], RESPONSE_CACHE_CONTROL)
+
 
 @router.get("/", response_model=APIResponse)
-async def get_scenarios():
+async def get_scenarios(request: Request):
     """Get all scenarios."""
-    try:
+    def build() -> APIResponse:
         scenarios = scenario_service.get_scenarios()
         return APIResponse(
             success=True,
             message=f"Found {len(scenarios)} scenarios",
             data=[scenario.model_dump() for scenario in scenarios]
         )
+    
+    try:
+        return await _cached_api_response(request, ("scenarios",), build)
     except Exception as e:
         logger.error(f"Failed to get scenarios: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{scenario_id}", response_model=APIResponse)
-async def get_scenario(scenario_id: str):
+async def get_scenario(scenario_id: str, request: Request):
     """Get specific scenario."""
-    try:
+    def build() -> APIResponse:
         scenario = scenario_service.get_scenario(scenario_id)
         if not scenario:
             raise HTTPException(status_code=404, detail="Scenario not found")
@@ -41,6 +77,9 @@ async def get_scenario(scenario_id: str):
             message="Scenario retrieved successfully",
             data=scenario.model_dump()
         )
+    
+    try:
+        return await _cached_api_response(request, ("scenario", scenario_id), build)
     except HTTPException:
         raise
     except Exception as e:
@@ -49,39 +88,45 @@ async def get_scenario(scenario_id: str):
 
 
 @router.get("/{scenario_id}/scenes", response_model=APIResponse)
-async def get_scenes(scenario_id: str):
+async def get_scenes(scenario_id: str, request: Request):
     """Get scenes for a scenario."""
-    try:
+    def build() -> APIResponse:
         scenes = scenario_service.get_scenes(scenario_id)
         return APIResponse(
             success=True,
             message=f"Found {len(scenes)} scenes",
             data=[scene.model_dump() for scene in scenes]
         )
+    
+    try:
+        return await _cached_api_response(request, ("scenes", scenario_id), build)
     except Exception as e:
         logger.error(f"Failed to get scenes for scenario {scenario_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{scenario_id}/scenes/{scene_id}/episodes", response_model=APIResponse)
-async def get_episodes(scenario_id: str, scene_id: str):
+async def get_episodes(scenario_id: str, scene_id: str, request: Request):
     """Get episodes for a scene."""
-    try:
+    def build() -> APIResponse:
         episodes = scenario_service.get_episodes(scenario_id, scene_id)
         return APIResponse(
             success=True,
             message=f"Found {len(episodes)} episodes",
             data=[episode.model_dump() for episode in episodes]
         )
+    
+    try:
+        return await _cached_api_response(request, ("episodes", scenario_id, scene_id), build)
     except Exception as e:
         logger.error(f"Failed to get episodes for scene {scenario_id}/{scene_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{scenario_id}/scenes/{scene_id}/episodes/{episode_id}", response_model=APIResponse)
-async def get_episode(scenario_id: str, scene_id: str, episode_id: str):
+async def get_episode(scenario_id: str, scene_id: str, episode_id: str, request: Request):
     """Get specific episode."""
-    try:
+    def build() -> APIResponse:
         episode = scenario_service.get_episode(episode_id, scenario_id, scene_id)
         if not episode:
             raise HTTPException(status_code=404, detail="Episode not found")
@@ -96,6 +141,9 @@ async def get_episode(scenario_id: str, scene_id: str, episode_id: str):
             message="Episode retrieved successfully",
             data=episode_data
         )
+    
+    try:
+        return await _cached_api_response(request, ("episode", scenario_id, scene_id, episode_id), build)
     except HTTPException:
         raise
     except Exception as e:
@@ -103,51 +151,57 @@ async def get_episode(scenario_id: str, scene_id: str, episode_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _mock_episode_data_points(time_points: int = 100) -> Iterator[Dict]:
+    """Generate mock joint trajectories (0 to 8 seconds) similar to recorded episode data."""
+    t = np.arange(time_points) * (8 / time_points)
+    
+    waist_observation = -0.01 + np.sin(t * 0.5) * 0.005
+    waist_action = waist_observation + (np.random.random(time_points) - 0.5) * 0.002
+    
+    forearm_roll = np.select(
+        [t < 1, t < 3, t < 6],
+        [0.0, -0.135 * (t - 1) / 2, -0.135],
+        -0.135 + 0.065 * (t - 6) / 2
+    )
+    wrist_rotate = np.select(
+        [t < 2, t < 6],
+        [0.045 * t / 2, 0.045 - 0.18 * (t - 2) / 4],
+        0.045 - 0.18 + 0.155 * (t - 6) / 2
+    )
+    
+    # Points are yielded one at a time so they can be encoded as they are
+    # produced; observation and action coincide for the forearm and wrist joints
+    for seconds, waist_obs, waist_act, forearm, wrist in zip(
+        t.tolist(), waist_observation.tolist(), waist_action.tolist(),
+        forearm_roll.tolist(), wrist_rotate.tolist()
+    ):
+        yield {
+            "time": seconds,
+            "left_waist": {"observation_state": waist_obs, "action": waist_act},
+            "left_forearm_roll": {"observation_state": forearm, "action": forearm},
+            "left_wrist_rotate": {"observation_state": wrist, "action": wrist}
+        }
+
+
+# The mock series does not depend on the episode, so it is generated and
+# encoded once; only episode_path is spliced in per request
+_MOCK_EPISODE_PREFIX = (
+    b'{"success":true,"message":"Episode data retrieved successfully","data":{"data_points":'
+    + b"[" + b",".join(orjson.dumps(point) for point in _mock_episode_data_points()) + b"]"
+    + b',"episode_path":'
+)
+_MOCK_EPISODE_SUFFIX = b',"note":"Mock data generated for visualization"},"error":null}'
+
+
 @router.get("/episodes/{episode_path:path}/data", response_model=APIResponse)
 async def get_episode_data(episode_path: str):
     """Get episode data for visualization."""
     try:
         # For now, return mock data similar to the image
         # In a real implementation, this would read from actual episode data files
-        
-        # Generate mock data similar to the attached image
-        data_points = []
-        time_points = 100  # 100 data points from 0 to 8 seconds
-        
-        for i in range(time_points):
-            time = (i / time_points) * 8
-            
-            # Generate data similar to the image
-            left_waist = {
-                "observation_state": -0.01 + math.sin(time * 0.5) * 0.005,
-                "action": -0.01 + math.sin(time * 0.5) * 0.005 + (random.random() - 0.5) * 0.002
-            }
-            
-            left_forearm_roll = {
-                "observation_state": 0 if time < 1 else -0.135 * (time - 1) / 2 if time < 3 else -0.135 if time < 6 else -0.135 + 0.065 * (time - 6) / 2,
-                "action": 0 if time < 1 else -0.135 * (time - 1) / 2 if time < 3 else -0.135 if time < 6 else -0.135 + 0.065 * (time - 6) / 2
-            }
-            
-            left_wrist_rotate = {
-                "observation_state": 0.045 * time / 2 if time < 2 else 0.045 - 0.18 * (time - 2) / 4 if time < 6 else 0.045 - 0.18 + 0.155 * (time - 6) / 2,
-                "action": 0.045 * time / 2 if time < 2 else 0.045 - 0.18 * (time - 2) / 4 if time < 6 else 0.045 - 0.18 + 0.155 * (time - 6) / 2
-            }
-            
-            data_points.append({
-                "time": time,
-                "left_waist": left_waist,
-                "left_forearm_roll": left_forearm_roll,
-                "left_wrist_rotate": left_wrist_rotate
-            })
-        
-        return APIResponse(
-            success=True,
-            message="Episode data retrieved successfully",
-            data={
-                "data_points": data_points,
-                "episode_path": episode_path,
-                "note": "Mock data generated for visualization"
-            }
+        return Response(
+            content=_MOCK_EPISODE_PREFIX + orjson.dumps(episode_path) + _MOCK_EPISODE_SUFFIX,
+            media_type="application/json"
         )
         
     except Exception as e:
@@ -1,9 +1,18 @@
 """
 SAM2-Hiera-Tiny model service for video processing.
 """
+import contextlib
+import copy
+import logging
+import re
+import tempfile
+import threading
 import time
 import os
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
 import cv2
 import numpy as np
 import torch
@@ -11,130 +20,532 @@ from sam2.sam2_video_predictor import SAM2VideoPredictor
 from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
 from services.task_manager import TaskStatus
 from sam2visualizations import create_simple_visualization
-from models import MaskData
+from config import settings
+from models import MaskData, RLEMask
+from utils.logging import logger
+from utils.masks import summarize_mask
+from video_utils import get_video_info
 
 # Configuration
 VIDEO_BASE_DIR = "data/videos"
 
+# Full-model torch.compile of the VOS predictor needs CUDA and torch >= 2.5.1
+VOS_OPTIMIZED_MIN_TORCH = (2, 5, 1)
+VOS_WARMUP_FRAME_SIZE = 1024
+# Without the VOS predictor, only the image encoder is compiled (CUDA graphs
+# via mode="reduce-overhead"), which needs torch >= 2.3
+IMAGE_ENCODER_COMPILE_MIN_TORCH = (2, 3, 0)
+
+# Point prompts decoded per mask decoder call by the automatic mask generator.
+# A 32x32 grid is 1024 prompts per crop: 4 batched calls on GPU instead of 16.
+MASK_GENERATOR_POINTS_PER_BATCH = {"cuda": 256, "cpu": 64}
+
+# Automatic mask generator settings per SAM2_QUALITY_PROFILE. "fast" prompts
+# a 16x16 grid on the full frame only: 256 prompts instead of 1024 on the
+# full frame plus 256 on each of four crops, for previews and visualizations
+MASK_GENERATOR_PROFILES = {
+    "quality": {"points_per_side": 32, "crop_n_layers": 1, "min_mask_region_area": 100},
+    "fast": {"points_per_side": 16, "crop_n_layers": 0, "min_mask_region_area": 256},
+}
+
+# Quantized (int8 or float8) image encoder features must stay this close
+# (cosine similarity) to the unquantized encoder's on a probe frame, or the
+# encoder is left unquantized
+QUANTIZED_MIN_FEATURE_SIMILARITY = 0.98
+# bfloat16 tensor cores arrived with Ampere; older GPUs only emulate it
+BF16_MIN_CAPABILITY = (8, 0)
+# GPUs from this compute capability (Ada, Hopper) have float8 tensor cores
+FLOAT8_MIN_CAPABILITY = (8, 9)
+# 2:4 semi-structured sparse tensor cores arrived with Ampere
+SPARSE_MIN_CAPABILITY = (8, 0)
+
+# Video predictor states (decoded frames and image features) are reused when
+# the same video is prompted again. Their decoded frames stay on the compute
+# device between requests, so idle states are cached up to this many bytes of
+# frames, and on CUDA to at most this fraction of the device's memory.
+STATE_CACHE_MAX_BYTES = 1 << 30
+STATE_CACHE_MAX_DEVICE_FRACTION = 0.1
+
+def _load_rgb(frame_path: str) -> np.ndarray:
+    """Decode a JPEG frame to an RGB array."""
+    frame_image = cv2.imread(frame_path)
+    if frame_image is None:
+        raise ValueError(f"Could not read frame: {frame_path}")
+    # Swap channels in place rather than allocating a second full frame
+    return cv2.cvtColor(frame_image, cv2.COLOR_BGR2RGB, dst=frame_image)
+
+
+# Propagated masks are RLE-encoded off the propagation thread; NumPy's
+# reductions release the GIL, so encoding overlaps with the next frame
+_mask_encoder = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="sam2-encode")
+MASK_ENCODE_WINDOW = 8
+
+
+def _mask_data(segmentation: Dict[str, List[int]], area: int, bbox: List[float]) -> MaskData:
+    """Build MaskData for a predicted mask from summarize_mask output.
+    
+    The values are produced here with the right types, so the models are
+    constructed without validation; re-checking every RLE run length for
+    each mask of each frame would cost more than encoding it.
+    """
+    mask_height, mask_width = segmentation['size']
+    return MaskData.model_construct(
+        segmentation=RLEMask.model_construct(**segmentation),
+        area=area,
+        bbox=bbox,
+        predicted_iou=0.9,  # Default value for propagated masks
+        point_coords=[[0, 0]],  # Default for propagated masks
+        stability_score=0.9,  # Default value for propagated masks
+        crop_box=[0.0, 0.0, float(mask_width), float(mask_height)]
+    )
+
+
+@lru_cache(maxsize=32)
+def _uniform_mask_rle(height: int, width: int, filled: bool) -> Tuple[Dict[str, List[int]], int]:
+    """RLE and area of an all-empty or all-filled mask, without allocating the mask."""
+    pixels = height * width
+    counts = [0, pixels] if filled else [pixels]
+    return {"size": [height, width], "counts": counts}, pixels if filled else 0
+
+
+def _summarize_masks(frame_masks) -> List[Tuple[Dict[str, List[int]], int, List[float]]]:
+    """RLE, area and bbox for each of a frame's masks."""
+    if hasattr(frame_masks, "detach"):
+        # One device-to-host copy for the whole frame rather than one per mask
+        frame_masks = frame_masks.detach().cpu().numpy()
+    return [summarize_mask(mask) for mask in frame_masks]
+
+
+def _copy_masks_to_host(frame_masks: torch.Tensor, copy_stream: "torch.cuda.Stream") -> Tuple[torch.Tensor, "torch.cuda.Event"]:
+    """Start copying a frame's masks into pinned host memory on a side stream.
+    
+    The copy overlaps with propagation of the next frame on the compute
+    stream. Pinned buffers come from torch's caching host allocator, which
+    recycles them once their copy has finished.
+    
+    Returns:
+        (host tensor, event recorded after the copy)
+    """
+    copy_stream.wait_stream(torch.cuda.current_stream())
+    host_masks = torch.empty(frame_masks.shape, dtype=frame_masks.dtype, pin_memory=True)
+    with torch.cuda.stream(copy_stream):
+        host_masks.copy_(frame_masks, non_blocking=True)
+        copied = torch.cuda.Event()
+        copied.record(copy_stream)
+    # Keep the device memory from being reused by the compute stream mid-copy
+    frame_masks.record_stream(copy_stream)
+    return host_masks, copied
+
+
+def _summarize_host_masks(host_masks: torch.Tensor, copied: "torch.cuda.Event") -> List[Tuple[Dict[str, List[int]], int, List[float]]]:
+    """_summarize_masks for masks copied by _copy_masks_to_host, once the copy has landed."""
+    copied.synchronize()
+    return _summarize_masks(host_masks.numpy())
+
+
+def _torch_at_least(version: Tuple[int, int, int]) -> bool:
+    """Whether the installed torch release is at least version."""
+    match = re.match(r"(\d+)\.(\d+)\.(\d+)", torch.__version__)
+    return match is not None and tuple(int(part) for part in match.groups()) >= version
+
+
+def _vos_optimized_supported(device: str) -> bool:
+    """Whether the compiled SAM2 VOS predictor can be used on this device."""
+    return device == "cuda" and _torch_at_least(VOS_OPTIMIZED_MIN_TORCH)
+
+
 class Sam2HieraTinyModel:
     """SAM2-Hiera-Tiny model implementation."""
     
     def __init__(self):
-        print("Loading SAM2-Hiera-Tiny model...")
+        logger.info("Loading SAM2-Hiera-Tiny model...")
+        # (jpeg folder, folder mtime) -> idle inference state, least recently used first
+        self._state_cache: "OrderedDict[Tuple[str, float], Dict[str, Any]]" = OrderedDict()
+        self._state_cache_lock = threading.Lock()
+        self._state_cache_max_bytes = STATE_CACHE_MAX_BYTES
+        # Tasks run on a thread pool but share one model on one device; the
+        # mask generator's image predictor also keeps per-image state, so
+        # inference runs one task at a time and the others queue here
+        self._inference_lock = threading.Lock()
+        # CUDA stream for copying propagated masks to the host alongside inference
+        self._copy_stream = None
+        # Reduced precision used by autocast on CUDA
+        self._autocast_dtype = torch.bfloat16
         
         try:
-            device = "cpu" if not torch.cuda.is_available() else "cuda"
-            print(f"Using device: {device}")
+            if settings.sam2_device == "auto":
+                if torch.cuda.is_available():
+                    device = "cuda"
+                elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+                    # Apple Silicon GPU; runs in fp32, as autocast on MPS is incomplete
+                    device = "mps"
+                else:
+                    device = "cpu"
+            else:
+                device = settings.sam2_device
+            self.device = device
+            logger.info(f"Using device: {device}")
             
-            # Load video predictor
-            self.predictor = SAM2VideoPredictor.from_pretrained("facebook/sam2-hiera-tiny", device=device)
+            if device == "cuda":
+                # TF32 tensor cores for any matmuls/convolutions left in FP32
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
+                # SAM2's attention layers call scaled_dot_product_attention;
+                # keep its fused kernels enabled, with the math kernel only as
+                # the fallback for shapes they do not support
+                torch.backends.cuda.enable_flash_sdp(True)
+                torch.backends.cuda.enable_mem_efficient_sdp(True)
+                # Frames are always resized to the model's input size, so the
+                # convolution algorithms cuDNN picks once stay the fastest
+                torch.backends.cudnn.benchmark = True
+                # bfloat16 needs Ampere or newer; Turing and Volta tensor
+                # cores run float16 instead of emulating bfloat16.
+                # is_bf16_supported() also reports emulated support, so check
+                # the compute capability itself
+                if torch.cuda.get_device_capability() < BF16_MIN_CAPABILITY:
+                    self._autocast_dtype = torch.float16
+                self._copy_stream = torch.cuda.Stream()
+                total_memory = torch.cuda.get_device_properties(torch.cuda.current_device()).total_memory
+                self._state_cache_max_bytes = min(
+                    STATE_CACHE_MAX_BYTES, int(total_memory * STATE_CACHE_MAX_DEVICE_FRACTION)
+                )
+            
+            # Load video predictor; on CUDA use the VOS-optimized predictor,
+            # which compiles the full model and replays it with CUDA graphs
+            vos_optimized = _vos_optimized_supported(device)
+            self.predictor = None
+            if vos_optimized:
+                try:
+                    self.predictor = SAM2VideoPredictor.from_pretrained(
+                        "facebook/sam2-hiera-tiny", device=device, vos_optimized=True
+                    )
+                except TypeError as e:
+                    # sam2 releases before the VOS predictor reject the flag
+                    logger.warning(f"VOS-optimized SAM2 predictor unavailable: {e}")
+                    vos_optimized = False
+            if self.predictor is None:
+                self.predictor = SAM2VideoPredictor.from_pretrained("facebook/sam2-hiera-tiny", device=device)
             self.model = self.predictor
             
-            print("SAM2-Hiera-Tiny model loaded successfully.")
+            logger.info(f"SAM2-Hiera-Tiny model loaded successfully (VOS optimized: {vos_optimized}).")
+            # Quantize before any warm-up so the compiled graphs use the int8 kernels
+            if device == "cuda" and settings.sam2_quantize:
+                self._quantize_image_encoder()
+            if (device == "cuda" and settings.sam2_sparsify_decoder
+                    and torch.cuda.get_device_capability() >= SPARSE_MIN_CAPABILITY):
+                self._sparsify_mask_decoder()
+            if vos_optimized:
+                self._warm_up_compiled_predictor()
             
             # Initialize automatic mask generator
             try:
+                profile_name = settings.sam2_quality_profile
+                if profile_name not in MASK_GENERATOR_PROFILES:
+                    logger.warning(f"Unknown SAM2_QUALITY_PROFILE {profile_name!r}, using 'quality'")
+                    profile_name = "quality"
                 self.mask_generator = SAM2AutomaticMaskGenerator(
                     model=self.model,
-                    points_per_side=32,
+                    points_per_batch=MASK_GENERATOR_POINTS_PER_BATCH.get(device, 64),
                     pred_iou_thresh=0.86,
                     stability_score_thresh=0.92,
-                    crop_n_layers=1,
                     crop_n_points_downscale_factor=2,
-                    min_mask_region_area=100,
+                    **MASK_GENERATOR_PROFILES[profile_name],
                 )
-                print("SAM2 automatic mask generator initialized successfully.")
+                logger.info(f"SAM2 automatic mask generator initialized successfully ({profile_name} profile).")
                 self.mask_generator_available = True
+                if device == "cuda" and not vos_optimized and _torch_at_least(IMAGE_ENCODER_COMPILE_MIN_TORCH):
+                    self._compile_image_encoder()
             except Exception as e:
-                print(f"Warning: Could not initialize automatic mask generator: {e}")
+                logger.warning(f"Could not initialize automatic mask generator: {e}")
                 self.mask_generator = None
                 self.mask_generator_available = False
             
             self.model_available = True
         except Exception as e:
-            print(f"Error loading SAM2 model: {e}")
+            logger.error(f"Error loading SAM2 model: {e}")
+            self.device = "cpu"
+            self._copy_stream = None
             self.predictor = None
             self.model = None
             self.mask_generator = None
             self.model_available = False
             self.mask_generator_available = False
 
-    def process_video(self, video_path: str, prompts: List[Dict[str, Any]], mode: str = "automatic_mask_generator") -> Dict[str, Any]:
-        """Process video with SAM2 model."""
-        print(f"SAM2 processing: {video_path}, mode: {mode}")
+    def _warm_up_compiled_predictor(self):
+        """Run one propagation on dummy frames so compilation happens at startup, not in the first task."""
+        start = time.time()
+        try:
+            # Same autocast/inference mode as real tasks, so they reuse the compiled graphs
+            with tempfile.TemporaryDirectory() as frames_dir, self._inference_context():
+                frame = np.zeros((VOS_WARMUP_FRAME_SIZE, VOS_WARMUP_FRAME_SIZE, 3), dtype=np.uint8)
+                for frame_idx in range(2):
+                    cv2.imwrite(os.path.join(frames_dir, f"{frame_idx:05d}.jpg"), frame)
+                
+                state = self.predictor.init_state(frames_dir)
+                center = VOS_WARMUP_FRAME_SIZE / 2
+                self.predictor.add_new_points_or_box(
+                    state, frame_idx=0, obj_id=1,
+                    points=np.array([[center, center]], dtype=np.float32),
+                    labels=np.array([1], dtype=np.int32)
+                )
+                for _ in self.predictor.propagate_in_video(state):
+                    pass
+                self.predictor.reset_state(state)
+            logger.info(f"SAM2 compiled predictor warmed up in {time.time() - start:.1f}s")
+        except Exception as e:
+            # The first real task pays the compile cost instead
+            logger.warning(f"SAM2 predictor warm-up failed: {e}")
+    
+    def _inference_context(self) -> contextlib.ExitStack:
+        """No-autograd inference, with bfloat16 (float16 before Ampere) autocast on CUDA; CPU stays in FP32."""
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.inference_mode())
+        if self.device == "cuda":
+            stack.enter_context(torch.autocast("cuda", dtype=self._autocast_dtype))
+        return stack
+    
+    def _add_frame_result(
+        self,
+        segmentation_results: List[Dict[str, Any]],
+        object_tracking: Dict[int, Dict[str, Any]],
+        frame_idx: int,
+        object_ids: List[int],
+        summaries: Future
+    ):
+        """Build the MaskData for one propagated frame once its masks are encoded."""
+        frame_masks_list = [_mask_data(*summary) for summary in summaries.result()]
+        
+        # Initialize object tracking for first frame
+        if frame_idx == 0:
+            for obj_id, mask_data in zip(object_ids, frame_masks_list):
+                object_tracking[obj_id] = {
+                    'first_frame': 0,
+                    'initial_mask': mask_data.segmentation
+                }
+        
+        segmentation_results.append({
+            'frame_idx': frame_idx,
+            'object_ids': list(object_ids),
+            'masks': frame_masks_list,
+            'timestamp': time.time()
+        })
+    
+    def _checkout_state(self, jpeg_folder_path: str) -> Tuple[Tuple[str, float], Dict[str, Any]]:
+        """Take an inference state for a frame folder, reusing a cached one if idle.
+        
+        A cached state is removed from the cache while in use, so concurrent
+        tasks on the same video never share one; the second task builds its own.
+        Idle states are recycled with reset_state rather than rebuilt, which
+        keeps their decoded frames and GPU allocations.
+        """
+        key = (jpeg_folder_path, os.stat(jpeg_folder_path).st_mtime)
+        with self._state_cache_lock:
+            state = self._state_cache.pop(key, None)
+        if state is None:
+            # Only the first frame is loaded up front; the rest stream in on a
+            # background thread while the prompts are applied to frame 0
+            return key, self.predictor.init_state(jpeg_folder_path, async_loading_frames=True)
+        # Drop the previous task's prompts and outputs, keeping frames and features
+        self.predictor.reset_state(state)
+        logger.debug(f"Reusing cached SAM2 state for {jpeg_folder_path}")
+        return key, state
+    
+    def _state_bytes(self, state: Dict[str, Any]) -> int:
+        """Bytes of decoded frames an inference state holds: float32 RGB at the model's input size."""
+        return state.get("num_frames", 0) * 3 * self.predictor.image_size ** 2 * 4
+    
+    def _return_state(self, key: Tuple[str, float], state: Dict[str, Any]):
+        """Put an inference state back in the cache, evicting the oldest over the byte budget."""
+        if self._state_bytes(state) > self._state_cache_max_bytes:
+            return
+        with self._state_cache_lock:
+            # States for an older version of the same folder are never hit again
+            stale_keys = [k for k in self._state_cache if k[0] == key[0] and k != key]
+            for stale_key in stale_keys:
+                del self._state_cache[stale_key]
+            self._state_cache[key] = state
+            cached_bytes = sum(self._state_bytes(cached) for cached in self._state_cache.values())
+            evicted_count = len(stale_keys)
+            while cached_bytes > self._state_cache_max_bytes:
+                cached_bytes -= self._state_bytes(self._state_cache.popitem(last=False)[1])
+                evicted_count += 1
+        if evicted_count and self.device == "cuda":
+            # Evicted states hold whole videos of frames and features; hand
+            # that memory back rather than leaving it in the caching allocator
+            torch.cuda.empty_cache()
+    
+    def _quantize_image_encoder(self):
+        """Quantize the image encoder's linear layers via torchao.
+        
+        Uses float8 on GPUs with float8 tensor cores and int8 elsewhere, with
+        activations quantized dynamically. A quantized copy is compared with
+        the original on a probe frame first, and the live encoder is only
+        quantized in place if their features match, so a compiled forward
+        already attached by the VOS predictor picks up the quantized layers.
+        """
+        try:
+            from torchao.quantization import int8_dynamic_activation_int8_weight, quantize_
+        except ImportError:
+            logger.warning("SAM2_QUANTIZE is set but torchao is not installed; using the bf16 image encoder")
+            return
+        
+        scheme, quantization = "int8", int8_dynamic_activation_int8_weight
+        if torch.cuda.get_device_capability() >= FLOAT8_MIN_CAPABILITY:
+            try:
+                from torchao.quantization import float8_dynamic_activation_float8_weight
+                scheme, quantization = "float8", float8_dynamic_activation_float8_weight
+            except ImportError:
+                pass
+        
+        encoder = self.predictor.image_encoder
+        try:
+            candidate = copy.deepcopy(encoder)
+            quantize_(candidate, quantization())
+            
+            # Call the class forward directly: an instance-level compiled
+            # forward would still be bound to the original encoder
+            forward = type(encoder).forward
+            probe = torch.rand(1, 3, self.predictor.image_size, self.predictor.image_size, device=self.device)
+            with self._inference_context():
+                expected = forward(encoder, probe)["vision_features"].float().flatten()
+                actual = forward(candidate, probe)["vision_features"].float().flatten()
+            del candidate
+            similarity = torch.nn.functional.cosine_similarity(expected, actual, dim=0).item()
+            if similarity < QUANTIZED_MIN_FEATURE_SIMILARITY:
+                logger.warning(f"{scheme} image encoder diverges from bf16 (similarity {similarity:.4f}); not using it")
+                return
+            
+            quantize_(encoder, quantization())
+            logger.info(f"SAM2 image encoder quantized to {scheme} (feature similarity {similarity:.4f})")
+        except Exception as e:
+            logger.warning(f"SAM2 image encoder quantization failed, using bf16: {e}")
+    
+    def _sparsify_mask_decoder(self):
+        """Prune the mask decoder's linear layers to 2:4 semi-structured sparsity for sparse tensor cores.
+        
+        Weights are magnitude-pruned (the two largest of every four are kept)
+        without fine-tuning, which is why this is opt-in. Layers whose shapes
+        the sparse kernels do not support stay dense, and any failure
+        restores every layer's dense weights.
+        """
+        from torch.sparse import to_sparse_semi_structured
+        
+        originals = {}
+        try:
+            with self._inference_context():
+                for module in self.predictor.sam_mask_decoder.modules():
+                    if not isinstance(module, torch.nn.Linear):
+                        continue
+                    out_features, in_features = module.weight.shape
+                    if out_features % 64 or in_features % 64:
+                        continue
+                    weight = module.weight.detach()
+                    groups = weight.reshape(-1, 4)
+                    keep = groups.abs().topk(2, dim=1).indices
+                    pruned = torch.zeros_like(groups).scatter_(1, keep, groups.gather(1, keep)).reshape_as(weight)
+                    originals[module] = module.weight
+                    # Store the sparse weight in the dtype autocast runs the layer in
+                    module.weight = torch.nn.Parameter(
+                        to_sparse_semi_structured(pruned.to(self._autocast_dtype)), requires_grad=False
+                    )
+                    # Fail here rather than in the first task if the kernel rejects the layer
+                    module(torch.zeros(64, in_features, device=self.device))
+            logger.info(f"SAM2 mask decoder: {len(originals)} linear layers pruned to 2:4 sparsity")
+        except Exception as e:
+            for module, weight in originals.items():
+                module.weight = weight
+            logger.warning(f"SAM2 mask decoder sparsification failed, using dense weights: {e}")
+    
+    def _compile_image_encoder(self):
+        """Compile the image encoder the mask generator runs per crop, warming it up at startup.
+        
+        Falls back to the eager encoder if compilation or the warm-up fails.
+        """
+        model = self.mask_generator.predictor.model
+        eager_encoder = model.image_encoder
+        start = time.time()
+        try:
+            model.image_encoder = torch.compile(eager_encoder, mode="reduce-overhead", fullgraph=True)
+            frame = np.zeros((VOS_WARMUP_FRAME_SIZE, VOS_WARMUP_FRAME_SIZE, 3), dtype=np.uint8)
+            with self._inference_context():
+                self.mask_generator.generate(frame)
+            logger.info(f"SAM2 image encoder compiled and warmed up in {time.time() - start:.1f}s")
+        except Exception as e:
+            model.image_encoder = eager_encoder
+            logger.warning(f"SAM2 image encoder compilation failed, using eager mode: {e}")
+    
+    def process_video(
+        self,
+        video_path: str,
+        prompts: List[Dict[str, Any]],
+        mode: str = "automatic_mask_generator",
+        force_simulate: bool = False
+    ) -> Dict[str, Any]:
+        """Process video with SAM2 model, or simulate it if the model is unavailable or force_simulate is set."""
+        logger.debug(f"SAM2 processing: {video_path}, mode: {mode}")
         
         # Get video properties
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
+        video_info = get_video_info(video_path)
+        if video_info is None:
             raise ValueError(f"Could not open video file: {video_path}")
         
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        cap.release()
+        fps = video_info['fps']
+        frame_count_total = video_info['frame_count']
+        width = video_info['width']
+        height = video_info['height']
         
-        print(f"Video: {frame_count_total} frames, {width}x{height}, {fps} FPS")
+        logger.debug(f"Video: {frame_count_total} frames, {width}x{height}, {fps} FPS")
         
         # Check if model is available
-        if not self.model_available:
-            print("SAM2 model not available, using simulated processing...")
+        if force_simulate or not self.model_available:
+            logger.warning("SAM2 model not available, using simulated processing...")
             return self._simulate_processing(video_path, frame_count_total, width, height)
         
         # Choose processing mode
         if mode == "automatic_mask_generator":
-            return self._process_with_automatic_mask_generator(video_path, frame_count_total, width, height)
+            with self._inference_lock, self._inference_context():
+                return self._process_with_automatic_mask_generator(video_path, frame_count_total, width, height)
         elif mode == "video_predictor":
-            return self._process_with_video_predictor(video_path, prompts, frame_count_total, width, height)
+            with self._inference_lock, self._inference_context():
+                return self._process_with_video_predictor(video_path, prompts, frame_count_total, width, height)
         else:
             raise ValueError(f"Unknown processing mode: {mode}")
 
     def _simulate_processing(self, video_path: str, frame_count_total: int, width: int, height: int) -> Dict[str, Any]:
         """Simulate processing for testing."""
-        time.sleep(2)  # Simulate processing time
+        # The simulated masks are the same on every frame, so they are built
+        # once and shared by all frame results
+        box = [0.0, 0.0, float(width//4), float(height//4)]
+        empty_rle, empty_area = _uniform_mask_rle(height//4, width//4, filled=False)
+        full_rle, full_area = _uniform_mask_rle(height//4, width//4, filled=True)
+        empty_mask = MaskData(
+            segmentation=empty_rle,
+            area=empty_area,
+            bbox=box,
+            predicted_iou=0.8,
+            point_coords=[[0, 0]],
+            stability_score=0.8,
+            crop_box=box
+        )
+        full_mask = MaskData(
+            segmentation=full_rle,
+            area=full_area,
+            bbox=box,
+            predicted_iou=0.9,
+            point_coords=[[0, 0]],
+            stability_score=0.9,
+            crop_box=box
+        )
         
         segmentation_results = []
         for frame_idx in range(0, min(10, frame_count_total), 2):
-            # Create MaskData objects instead of raw lists
-            mask_data_list = []
             if frame_idx % 4 == 0:
-                # Create two masks
-                mask1 = np.zeros((height//4, width//4), dtype=bool)
-                mask2 = np.ones((height//4, width//4), dtype=bool)
-                
-                mask_data1 = MaskData(
-                    segmentation=mask1.tolist(),
-                    area=int(np.sum(mask1)),
-                    bbox=[0.0, 0.0, float(width//4), float(height//4)],
-                    predicted_iou=0.8,
-                    point_coords=[[0, 0]],
-                    stability_score=0.8,
-                    crop_box=[0.0, 0.0, float(width//4), float(height//4)]
-                )
-                mask_data2 = MaskData(
-                    segmentation=mask2.tolist(),
-                    area=int(np.sum(mask2)),
-                    bbox=[0.0, 0.0, float(width//4), float(height//4)],
-                    predicted_iou=0.9,
-                    point_coords=[[0, 0]],
-                    stability_score=0.9,
-                    crop_box=[0.0, 0.0, float(width//4), float(height//4)]
-                )
-                mask_data_list = [mask_data1, mask_data2]
+                # Two masks
+                mask_data_list = [empty_mask, full_mask]
                 object_ids = [1, 2]
             else:
-                # Create one mask
-                mask = np.zeros((height//4, width//4), dtype=bool)
-                mask_data = MaskData(
-                    segmentation=mask.tolist(),
-                    area=int(np.sum(mask)),
-                    bbox=[0.0, 0.0, float(width//4), float(height//4)],
-                    predicted_iou=0.8,
-                    point_coords=[[0, 0]],
-                    stability_score=0.8,
-                    crop_box=[0.0, 0.0, float(width//4), float(height//4)]
-                )
-                mask_data_list = [mask_data]
+                # One mask
+                mask_data_list = [empty_mask]
                 object_ids = [1]
             
             frame_results = {
@@ -149,106 +560,85 @@ class Sam2HieraTinyModel:
             'video_path': video_path,
             'total_frames': frame_count_total,
             'segmentation_results': segmentation_results,
-            'object_tracking': {1: {'first_frame': 0, 'initial_mask': []}, 2: {'first_frame': 4, 'initial_mask': []}},
+            'object_tracking': {1: {'first_frame': 0, 'initial_mask': None}, 2: {'first_frame': 4, 'initial_mask': None}},
             'processing_time': time.time(),
             'note': 'Simulated processing'
         }
 
     def _process_with_automatic_mask_generator(self, video_path: str, frame_count_total: int, width: int, height: int) -> Dict[str, Any]:
         """Process video using SAM2 automatic mask generator."""
-        print("Using SAM2 automatic mask generator...")
+        logger.debug("Using SAM2 automatic mask generator...")
         
         # Convert MP4 path to JPEG folder path
         jpeg_folder_path = video_path.replace('.mp4', '')
-        print(f"Looking for JPEG folder: {jpeg_folder_path}")
+        logger.debug(f"Looking for JPEG folder: {jpeg_folder_path}")
         
         if not os.path.exists(jpeg_folder_path):
-            print("JPEG folder not found, falling back to simulated processing...")
+            logger.warning("JPEG folder not found, falling back to simulated processing...")
             return self._simulate_processing(video_path, frame_count_total, width, height)
         
         if not self.mask_generator_available or self.mask_generator is None:
-            print("Automatic mask generator not available, falling back to simulated processing...")
+            logger.warning("Automatic mask generator not available, falling back to simulated processing...")
             return self._simulate_processing(video_path, frame_count_total, width, height)
         
         try:
-            # Load first image from JPEG folder
-            jpeg_files = [f for f in os.listdir(jpeg_folder_path) if f.endswith('.jpg')]
-            jpeg_files.sort()
+            # List the JPEG frames; scandir's entries carry the d_type from readdir, so is_file()
+            # needs no per-frame stat
+            with os.scandir(jpeg_folder_path) as entries:
+                jpeg_files = sorted(
+                    entry.name for entry in entries
+                    if entry.name.endswith('.jpg') and entry.is_file()
+                )
             
             if not jpeg_files:
                 raise Exception(f"No JPEG files found in folder: {jpeg_folder_path}")
             
-            first_image_path = os.path.join(jpeg_folder_path, jpeg_files[0])
-            image = cv2.imread(first_image_path)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = _load_rgb(os.path.join(jpeg_folder_path, jpeg_files[0]))
             
-            print(f"Loaded image with shape: {image.shape}")
+            logger.debug(f"Loaded image with shape: {image.shape}")
             
             # Generate masks for the first frame
             masks_result = self.mask_generator.generate(image)
-            print(f"Generated {len(masks_result)} masks")
+            logger.debug(f"Generated {len(masks_result)} masks")
             
             # Ensure masks is a list
             if not isinstance(masks_result, list):
-                print(f"ERROR: mask generator returned {type(masks_result)}, expected list")
+                logger.error(f"mask generator returned {type(masks_result)}, expected list")
                 raise Exception(f"Expected masks to be a list, got {type(masks_result)}")
             
-            # Convert masks to the format expected by propagate_in_video
-            masks = [mask['segmentation'] for mask in masks_result]
-            
-            # Prepare video frames for propagate_in_video
-            print("Preparing video frames for propagate_in_video...")
-            video_frames = []
-            for jpeg_file in jpeg_files:
-                frame_path = os.path.join(jpeg_folder_path, jpeg_file)
-                frame_image = cv2.imread(frame_path)
-                frame_image = cv2.cvtColor(frame_image, cv2.COLOR_BGR2RGB)
-                video_frames.append(frame_image)
+            # Seed the video predictor with the first-frame masks, one object
+            # per mask. The predictor loads the remaining frames itself, so no
+            # other JPEG is decoded here.
+            state_key, state = self._checkout_state(jpeg_folder_path)
+            for mask_idx, mask in enumerate(masks_result):
+                self.predictor.add_new_mask(state, frame_idx=0, obj_id=mask_idx + 1, mask=mask['segmentation'])
             
             # Use propagate_in_video to track objects across all frames
-            print("Using propagate_in_video to track objects across frames...")
-            propagated_masks_generator = self.predictor.propagate_in_video(video_frames, masks)
-            # Convert generator to list
-            propagated_masks = list(propagated_masks_generator)
-            print(f"Propagated masks shape: {len(propagated_masks)} frames, {len(propagated_masks[0])} objects")
+            logger.debug("Using propagate_in_video to track objects across frames...")
+            propagated_masks = self.predictor.propagate_in_video(state)
             
-            # Process results into our expected format
+            # Each frame's masks are encoded on worker threads as the generator
+            # yields them, overlapping with propagation of the next frame. The
+            # window bounds how many frames of raw masks wait to be encoded.
             segmentation_results = []
             object_tracking = {}
+            pending = deque()
             
-            for frame_idx, (frame_masks, jpeg_file) in enumerate(zip(propagated_masks, jpeg_files)):
-                frame_path = os.path.join(jpeg_folder_path, jpeg_file)
-                frame_masks_list = []
-                frame_object_ids = []
-                
-                for mask_idx, mask in enumerate(frame_masks):
-                    # Create MaskData object for this mask
-                    mask_data = MaskData(
-                        segmentation=mask.tolist(),
-                        area=int(np.sum(mask)),
-                        bbox=self._get_bbox_from_mask(mask),
-                        predicted_iou=0.9,  # Default value for propagated masks
-                        point_coords=[[0, 0]],  # Default for propagated masks
-                        stability_score=0.9,  # Default value for propagated masks
-                        crop_box=[0.0, 0.0, float(mask.shape[1]), float(mask.shape[0])]
-                    )
-                    frame_masks_list.append(mask_data)
-                    frame_object_ids.append(mask_idx + 1)
-                    
-                    # Initialize object tracking for first frame
-                    if frame_idx == 0:
-                        object_tracking[mask_idx + 1] = {
-                            'first_frame': 0,
-                            'initial_mask': mask.tolist()
-                        }
-                
-                frame_results = {
-                    'frame_idx': frame_idx,
-                    'object_ids': frame_object_ids,
-                    'masks': frame_masks_list,
-                    'timestamp': time.time()
-                }
-                segmentation_results.append(frame_results)
+            for frame_idx, object_ids, mask_logits in propagated_masks:
+                if self._copy_stream is not None:
+                    host_masks, copied = _copy_masks_to_host(mask_logits > 0, self._copy_stream)
+                    summaries = _mask_encoder.submit(_summarize_host_masks, host_masks, copied)
+                else:
+                    summaries = _mask_encoder.submit(_summarize_masks, mask_logits > 0)
+                pending.append((frame_idx, object_ids, summaries))
+                if len(pending) > MASK_ENCODE_WINDOW:
+                    self._add_frame_result(segmentation_results, object_tracking, *pending.popleft())
+            while pending:
+                self._add_frame_result(segmentation_results, object_tracking, *pending.popleft())
+            # Only states from successful runs are reused
+            self._return_state(state_key, state)
+            
+            logger.debug(f"Propagated masks: {len(segmentation_results)} frames, {len(object_tracking)} objects")
             
             return {
                 'video_path': video_path,
@@ -260,41 +650,23 @@ class Sam2HieraTinyModel:
             }
             
         except Exception as e:
-            print(f"SAM2 automatic mask generator failed: {e}")
+            logger.warning(f"SAM2 automatic mask generator failed: {e}")
             return self._simulate_processing(video_path, frame_count_total, width, height)
     
-    def _get_bbox_from_mask(self, mask):
-        """Get bounding box from a binary mask."""
-        try:
-            # Find non-zero pixels
-            rows = np.any(mask, axis=1)
-            cols = np.any(mask, axis=0)
-            
-            if not np.any(rows) or not np.any(cols):
-                return [0, 0, 0, 0]
-            
-            y_min, y_max = np.where(rows)[0][[0, -1]]
-            x_min, x_max = np.where(cols)[0][[0, -1]]
-            
-            return [float(x_min), float(y_min), float(x_max - x_min + 1), float(y_max - y_min + 1)]
-        except:
-            return [0, 0, 0, 0]
-
     def _process_with_video_predictor(self, video_path: str, prompts: List[Dict[str, Any]], frame_count_total: int, width: int, height: int) -> Dict[str, Any]:
         """Process video using SAM2 video predictor."""
-        print("Using SAM2 video predictor...")
+        logger.debug("Using SAM2 video predictor...")
         
         # Convert MP4 path to JPEG folder path
         jpeg_folder_path = video_path.replace('.mp4', '')
         
         if not os.path.exists(jpeg_folder_path):
-            print("JPEG folder not found, falling back to simulated processing...")
+            logger.warning("JPEG folder not found, falling back to simulated processing...")
             return self._simulate_processing(video_path, frame_count_total, width, height)
         
         try:
             # Initialize SAM2 state with JPEG folder
-            device = "cpu" if not torch.cuda.is_available() else "cuda"
-            state = self.predictor.init_state(jpeg_folder_path)
+            state_key, state = self._checkout_state(jpeg_folder_path)
             
             # Process prompts if provided
             segmentation_results = []
@@ -319,20 +691,11 @@ class Sam2HieraTinyModel:
                             state, points, labels
                         )
                         
-                        # Convert masks to MaskData objects
-                        mask_data_list = []
-                        for mask in masks:
-                            mask_array = mask if hasattr(mask, 'tolist') else np.array(mask)
-                            mask_data = MaskData(
-                                segmentation=mask_array.tolist(),
-                                area=int(np.sum(mask_array)),
-                                bbox=self._get_bbox_from_mask(mask_array),
-                                predicted_iou=0.9,
-                                point_coords=[[0, 0]],
-                                stability_score=0.9,
-                                crop_box=[0.0, 0.0, float(mask_array.shape[1]), float(mask_array.shape[0])]
-                            )
-                            mask_data_list.append(mask_data)
+                        # Convert masks to MaskData objects; thresholding on the
+                        # device means only bool masks are copied back
+                        mask_data_list = [
+                            _mask_data(*summary) for summary in _summarize_masks(masks > 0)
+                        ]
                         
                         frame_results = {
                             'frame_idx': frame_idx_result,
@@ -342,12 +705,15 @@ class Sam2HieraTinyModel:
                         }
                         segmentation_results.append(frame_results)
                         
-                        for i, obj_id in enumerate(object_ids):
+                        for obj_id, mask_data in zip(object_ids, mask_data_list):
                             object_tracking[obj_id] = {
                                 'first_frame': frame_idx_result,
-                                'initial_mask': masks[i].tolist() if hasattr(masks[i], 'tolist') else masks[i]
+                                'initial_mask': mask_data.segmentation
                             }
             
+            # Only states from successful runs are reused
+            self._return_state(state_key, state)
+            
             return {
                 'video_path': video_path,
                 'total_frames': frame_count_total,
@@ -358,36 +724,36 @@ class Sam2HieraTinyModel:
             }
             
         except Exception as e:
-            print(f"SAM2 video predictor failed: {e}")
+            logger.warning(f"SAM2 video predictor failed: {e}")
             return self._simulate_processing(video_path, frame_count_total, width, height)
 
 # Global model instance
 ai_model: Optional[Sam2HieraTinyModel] = None
 try:
     ai_model = Sam2HieraTinyModel()
-    print(f"SAM2 model initialization completed. Model available: {ai_model.model_available}")
+    logger.info(f"SAM2 model initialization completed. Model available: {ai_model.model_available}")
 except Exception as e:
-    print(f"ERROR: Failed to load AI model at startup: {e}")
+    logger.error(f"Failed to load AI model at startup: {e}")
 
 # SAM2 video processing task function
 def _sam2_video_processing_task(task_id: str, progress_callback: callable, relative_video_path: str, prompts: List[Dict[str, Any]] = None, mode: str = "automatic_mask_generator"):
     """SAM2 video processing task function."""
     global ai_model
     
-    print(f"Task {task_id}: SAM2 processing started for video: {relative_video_path}")
+    logger.debug(f"Task {task_id}: SAM2 processing started for video: {relative_video_path}")
     if ai_model is None:
         raise Exception("AI model failed to load at startup or is not available.")
     
     progress_callback(0.1)
-    print(f"Task {task_id}: AI model is available")
+    logger.debug(f"Task {task_id}: AI model is available")
     
     full_video_path = os.path.join(VIDEO_BASE_DIR, relative_video_path)
-    print(f"Task {task_id}: Full video path: {full_video_path}")
+    logger.debug(f"Task {task_id}: Full video path: {full_video_path}")
     
     if not os.path.exists(full_video_path):
         raise Exception(f"Video file not found: {full_video_path}")
     
-    print(f"Task {task_id}: Video file exists, proceeding with processing")
+    logger.debug(f"Task {task_id}: Video file exists, proceeding with processing")
     
     # Use default prompts if none provided
     if prompts is None:
@@ -396,7 +762,8 @@ def _sam2_video_processing_task(task_id: str, progress_callback: callable, relat
             'prompts': [{'type': 'point', 'coordinates': [320, 240], 'label': 1}]
         }]
     
-    print(f"Task {task_id}: Using prompts: {prompts}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Task {task_id}: Using prompts: {prompts}")
     
     progress_callback(0.2)
     
@@ -404,32 +771,28 @@ def _sam2_video_processing_task(task_id: str, progress_callback: callable, relat
     try:
         result = ai_model.process_video(full_video_path, prompts, mode)
     except Exception as e:
-        print(f"Task {task_id}: SAM2 processing failed: {e}")
+        logger.warning(f"Task {task_id}: SAM2 processing failed: {e}")
         if "Only MP4 video and JPEG folder are supported" in str(e):
-            print(f"Task {task_id}: SAM2 rejected video format, using simulated processing...")
-            original_model_available = ai_model.model_available
-            ai_model.model_available = False
-            try:
-                result = ai_model.process_video(full_video_path, prompts, mode)
-            finally:
-                ai_model.model_available = original_model_available
+            logger.warning(f"Task {task_id}: SAM2 rejected video format, using simulated processing...")
+            # Simulate for this call only; other tasks keep using the model
+            result = ai_model.process_video(full_video_path, prompts, mode, force_simulate=True)
         else:
             raise e
     
-    print(f"Task {task_id}: SAM2 processing completed")
+    logger.info(f"Task {task_id}: SAM2 processing completed")
     
     # Automatically generate visualization if processing was successful
     try:
-        print(f"Task {task_id}: Generating visualization...")
+        logger.debug(f"Task {task_id}: Generating visualization...")
         viz_result = create_simple_visualization(task_id, result)
         result['visualization'] = viz_result
         # Extract visualization path for easy access
         if viz_result and 'visualization_path' in viz_result:
             result['visualization_path'] = viz_result['visualization_path']
-            print(f"Task {task_id}: Visualization generated at: {viz_result['visualization_path']}")
-        print(f"Task {task_id}: Visualization generated successfully")
+            logger.info(f"Task {task_id}: Visualization generated at: {viz_result['visualization_path']}")
+        logger.debug(f"Task {task_id}: Visualization generated successfully")
     except Exception as viz_error:
-        print(f"Task {task_id}: Visualization generation failed: {viz_error}")
+        logger.warning(f"Task {task_id}: Visualization generation failed: {viz_error}")
         result['visualization_error'] = str(viz_error)
     
     return result
\ No newline at end of file
@@ -3,22 +3,394 @@ SAM2 Video Visualization Module
 Creates visualization videos from SAM2 segmentation results.
 """
 import os
+import shutil
+import subprocess
 import cv2
 import numpy as np
-import colorsys
-from typing import Dict, Any, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
+from utils.logging import logger
+from utils.masks import decode_rle, decode_rle_box, rle_bbox
 
-def generate_colors(num_colors: int) -> List[List[int]]:
-    """Generate distinct colors for segmentation masks"""
-    colors = []
-    for i in range(num_colors):
-        hue = i / num_colors
-        saturation = 0.8
-        value = 0.9
-        rgb = colorsys.hsv_to_rgb(hue, saturation, value)
-        colors.append([int(rgb[2] * 255), int(rgb[1] * 255), int(rgb[0] * 255)])  # BGR format
-    return colors
+# Decoding and drawing run in OpenCV/NumPy code that releases the GIL, so
+# frames are rendered on worker threads; at most RENDER_AHEAD rendered frames
+# wait in memory for the writer
+RENDER_WORKERS = min(8, os.cpu_count() or 1)
+RENDER_AHEAD = 2 * RENDER_WORKERS
+_frame_workers = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="viz-render")
+
+# JPEG bytes are read from disk on separate I/O threads, so a render worker
+# never waits on the filesystem; READ_AHEAD files are kept in flight
+READ_AHEAD = 8
+_file_reader = ThreadPoolExecutor(max_workers=4, thread_name_prefix="viz-read")
+
+_DONE = object()
+
+# ffmpeg H.264 encoders in order of preference: NVENC on NVIDIA GPUs, then
+# x264 tuned for speed; without ffmpeg, OpenCV's own encoder is used
+_FFMPEG_ENCODERS = (
+    ("h264_nvenc", ["-preset", "p1", "-tune", "ll"]),
+    ("libx264", ["-preset", "ultrafast", "-tune", "zerolatency"]),
+)
+
+
+def _map_ahead(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    executor: ThreadPoolExecutor = _frame_workers,
+    ahead: int = RENDER_AHEAD
+) -> Iterator[Any]:
+    """Yield fn(item) for each item in order, computing up to `ahead` results in advance on `executor`."""
+    pending = deque()
+    items = iter(items)
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= ahead:
+            break
+    try:
+        while pending:
+            result = pending.popleft().result()
+            item = next(items, _DONE)
+            if item is not _DONE:
+                pending.append(executor.submit(fn, item))
+            yield result
+    finally:
+        # Don't leave work queued if the consumer stops early or a frame fails
+        for future in pending:
+            future.cancel()
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    """Read a file's bytes, or None if it can't be read."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError as e:
+        logger.warning(f"Could not read frame {path}: {e}")
+        return None
+
+
+@lru_cache(maxsize=1)
+def _ffmpeg_encoder() -> Optional[Tuple[str, str, List[str]]]:
+    """(ffmpeg path, codec, codec options) for the first encoder that works on this host, or None."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    for codec, options in _FFMPEG_ENCODERS:
+        # A listed encoder can still lack a device or driver, so try a tiny encode
+        try:
+            probe = subprocess.run(
+                [ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+                 "-i", "color=size=256x256:duration=0.1", "-c:v", codec, *options, "-f", "null", "-"],
+                capture_output=True, timeout=30
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if probe.returncode == 0:
+            logger.info(f"Visualizations will be encoded by ffmpeg with {codec}")
+            return ffmpeg, codec, options
+    return None
+
+
+class _FfmpegVideoWriter:
+    """Pipes BGR frames to an ffmpeg encoder; offers the write/release calls used from cv2.VideoWriter."""
+    
+    def __init__(self, ffmpeg: str, codec: str, options: List[str], output_path: str, fps: float, width: int, height: int):
+        self._shape = (height, width, 3)
+        self._process = subprocess.Popen(
+            [ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+             # yuv420p (even dimensions) and faststart keep the file playable in browsers
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", codec, *options,
+             "-pix_fmt", "yuv420p", "-movflags", "+faststart", output_path],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20
+        )
+    
+    def write(self, frame: np.ndarray):
+        # Like cv2.VideoWriter, skip frames of another size rather than corrupt the raw stream
+        if frame.shape != self._shape:
+            return
+        self._process.stdin.write(np.ascontiguousarray(frame).data)
+    
+    def release(self):
+        self._process.stdin.close()
+        stderr = self._process.stderr.read()
+        if self._process.wait() != 0:
+            raise Exception(f"ffmpeg failed to encode visualization: {stderr.decode(errors='replace').strip()}")
+    
+    def abort(self):
+        """Stop the encoder without finishing the file; safe after release."""
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        for pipe in (self._process.stdin, self._process.stderr):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+def _open_video_writer(output_path: str, fps: float, width: int, height: int):
+    """Open an H.264 writer for the visualization, preferring a hardware ffmpeg encoder."""
+    encoder = _ffmpeg_encoder()
+    if encoder is not None:
+        return _FfmpegVideoWriter(*encoder, output_path, fps, width, height)
+    # Use H.264 codec (avc1) for better browser compatibility
+    fourcc = cv2.VideoWriter_fourcc(*'avc1')
+    return cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+
+
+def _discard_video_writer(writer, output_path: str):
+    """Stop a writer from _open_video_writer after a failure and remove its partial output."""
+    try:
+        if isinstance(writer, _FfmpegVideoWriter):
+            writer.abort()
+        else:
+            writer.release()
+    except Exception as e:
+        logger.warning(f"Could not close visualization writer for {output_path}: {e}")
+    try:
+        os.remove(output_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove partial visualization {output_path}: {e}")
+
+
+@lru_cache(maxsize=1024)
+def _text_mask(text: str, font_scale: float, thickness: int) -> Tuple[np.ndarray, int, int]:
+    """Rasterize text once as a bool mask; returns (mask, x offset, y offset) of its top-left from the text origin."""
+    (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    pad = thickness + 1  # strokes extend past the nominal glyph box
+    mask = np.zeros((text_height + baseline + 2 * pad, text_width + 2 * pad), dtype=np.uint8)
+    cv2.putText(mask, text, (pad, pad + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1, thickness, cv2.LINE_8)
+    mask = mask.astype(bool)
+    mask.setflags(write=False)  # shared between render threads
+    return mask, -pad, -(pad + text_height)
+
+
+def _stamp_text(image: np.ndarray, text: str, org: Tuple[int, int], font_scale: float, color: Tuple[int, int, int], thickness: int):
+    """
+    Draw text like cv2.putText with FONT_HERSHEY_SIMPLEX, from a cached mask
+    
+    Labels that repeat across frames (object IDs, object counts, the SAM2
+    caption) are rasterized once rather than on every frame. Both this and
+    the direct putText calls pass LINE_8 explicitly, so the stamped labels
+    match them even if OpenCV's default line type changes.
+    """
+    mask, dx, dy = _text_mask(text, font_scale, thickness)
+    x0, y0 = org[0] + dx, org[1] + dy
+    mask_height, mask_width = mask.shape
+    image_height, image_width = image.shape[:2]
+    # Clip the mask to the image
+    left, top = max(0, -x0), max(0, -y0)
+    right, bottom = min(mask_width, image_width - x0), min(mask_height, image_height - y0)
+    if right <= left or bottom <= top:
+        return
+    region = image[y0 + top:y0 + bottom, x0 + left:x0 + right]
+    region[mask[top:bottom, left:right]] = color
+
+
+def generate_colors(num_colors: int) -> np.ndarray:
+    """Generate distinct colors for segmentation masks as an (num_colors, 3) uint8 BGR array"""
+    # Evenly spaced hues at 80% saturation and 90% value, converted in one call
+    hsv = np.empty((1, num_colors, 3), dtype=np.uint8)
+    hsv[0, :, 0] = np.arange(num_colors) * 180 // num_colors  # OpenCV hue is 0-179
+    hsv[0, :, 1] = 204
+    hsv[0, :, 2] = 229
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0]
+
+
+def _frame_objects(frame_segmentation: Dict[str, Any], max_objects: int) -> Dict[str, Any]:
+    """
+    Flatten one frame's masks into per-field arrays for the render loop
+    
+    Fields are pulled out of the MaskData objects or dicts once, and each
+    mask's bounding box is computed from its RLE runs, so the loop never
+    branches on the mask format and skips empty masks without decoding them.
+    
+    Args:
+        frame_segmentation: Segmentation result for one frame
+        max_objects: Number of objects that have a color; extra masks are dropped
+        
+    Returns:
+        Dict of equal-length fields: object_ids, rles (RLE dicts with counts
+        as an int64 array, None for raw masks),
+        arrays (decoded raw masks, else None), sizes (int32 [n, 2] mask
+        height and width), bboxes (int32 [n, 4] x, y, width, height),
+        predicted_iou and stability_score (float32 [n]) and scored (bool [n],
+        whether to print the scores)
+    """
+    object_ids = frame_segmentation.get('object_ids', [])
+    masks = frame_segmentation.get('masks', [])
+    
+    # Ensure object_ids and masks are lists
+    if not isinstance(object_ids, list):
+        logger.warning(f"object_ids is not a list: {type(object_ids)}")
+        object_ids = []
+    if not isinstance(masks, list):
+        logger.warning(f"masks is not a list: {type(masks)}")
+        masks = []
+    
+    count = min(len(object_ids), len(masks), max_objects)
+    rles = [None] * count
+    arrays = [None] * count
+    sizes = np.zeros((count, 2), dtype=np.int32)
+    bboxes = np.zeros((count, 4), dtype=np.int32)
+    predicted_iou = np.zeros(count, dtype=np.float32)
+    stability_score = np.zeros(count, dtype=np.float32)
+    scored = np.zeros(count, dtype=bool)
+    
+    for i, mask_data in enumerate(masks[:count]):
+        # Extract segmentation mask - handle both MaskData objects and dict format
+        if hasattr(mask_data, 'segmentation'):
+            # MaskData object
+            rle = mask_data.segmentation
+            predicted_iou[i] = mask_data.predicted_iou
+            stability_score[i] = mask_data.stability_score
+        elif isinstance(mask_data, dict):
+            # Dictionary format
+            rle = mask_data['segmentation']
+            predicted_iou[i] = mask_data.get('predicted_iou', 0.0)
+            stability_score[i] = mask_data.get('stability_score', 0.0)
+            scored[i] = True
+        else:
+            # Fallback for old format (raw arrays); uint8 arrays are used as is
+            arrays[i] = np.asarray(mask_data, dtype=np.uint8)
+            sizes[i] = arrays[i].shape[:2]
+            continue
+        # Convert the run lengths to an array once, for both the box and the decode
+        size, counts = (rle['size'], rle['counts']) if isinstance(rle, dict) else (rle.size, rle.counts)
+        rles[i] = {'size': size, 'counts': np.asarray(counts, dtype=np.int64)}
+        sizes[i] = size
+        bboxes[i] = rle_bbox(rles[i])
+    
+    return {
+        'object_ids': object_ids[:count],
+        'rles': rles,
+        'arrays': arrays,
+        'sizes': sizes,
+        'bboxes': bboxes,
+        'predicted_iou': predicted_iou,
+        'stability_score': stability_score,
+        'scored': scored,
+    }
+
+
+def _render_frame(
+    frame_bytes: Optional[bytes],
+    frame_idx: int,
+    total_frames: int,
+    frame_segmentation: Optional[Dict[str, Any]],
+    colors: np.ndarray,
+    palette: np.ndarray,
+    label_dtype: type
+) -> Optional[np.ndarray]:
+    """
+    Decode one JPEG frame and draw its masks and annotations
+    
+    Args:
+        frame_bytes: Encoded JPEG frame, or None if it could not be read
+        frame_idx: Index of the frame in the video
+        total_frames: Number of frames in the video, for the frame counter
+        frame_segmentation: Segmentation result for this frame, if any
+        colors: Per-object BGR colors from generate_colors
+        palette: colors with a background row prepended, indexed by label
+        label_dtype: Smallest integer dtype that holds every label
+        
+    Returns:
+        The annotated frame, or None if the JPEG could not be read or decoded
+    """
+    if not frame_bytes:
+        return None
+    frame = cv2.imdecode(np.frombuffer(frame_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    
+    # Draw straight onto the decoded frame: it is a fresh buffer no one else
+    # holds, and the blend reads each pixel before overwriting it
+    overlay = frame
+    
+    if frame_segmentation:
+        objects = _frame_objects(frame_segmentation, len(colors))
+        
+        # Paint every mask into one label image, then color and blend
+        # the frame once; later objects are drawn over earlier ones
+        label = None
+        painted = None  # union bounding box of the masks as [x0, y0, x1, y1]
+        annotations = []
+        
+        for i, obj_id in enumerate(objects['object_ids']):
+            mask_array = objects['arrays'][i]
+            if mask_array is None and tuple(objects['sizes'][i]) == frame.shape[:2]:
+                # The box comes from the RLE runs, so empty masks are never decoded
+                # and other masks are decoded only within their box
+                x, y, w, h = objects['bboxes'][i]
+                if not (w and h):
+                    continue
+                mask_roi = decode_rle_box(objects['rles'][i], (x, y, w, h))
+            else:
+                if mask_array is None:
+                    mask_array = decode_rle(objects['rles'][i])
+                
+                # Resize mask to match frame dimensions if needed
+                if mask_array.shape[:2] != frame.shape[:2]:
+                    logger.debug("Resizing mask from %s to %s", mask_array.shape[:2], frame.shape[:2])
+                    mask_array = cv2.resize(mask_array, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_NEAREST)
+                x, y, w, h = cv2.boundingRect(mask_array)
+                if not (w and h):
+                    continue
+                mask_roi = mask_array[y:y + h, x:x + w]
+            
+            # Only the mask's bounding box is touched
+            if label is None:
+                label = np.zeros(frame.shape[:2], dtype=label_dtype)
+                painted = [x, y, x + w, y + h]
+            else:
+                painted = [min(painted[0], x), min(painted[1], y),
+                           max(painted[2], x + w), max(painted[3], y + h)]
+            label[y:y + h, x:x + w][mask_roi > 0] = i + 1
+            
+            # Object ID and info text go at the mask's centroid
+            moments = cv2.moments(mask_roi, binaryImage=True)
+            center_x = x + int(moments['m10'] / moments['m00'])
+            center_y = y + int(moments['m01'] / moments['m00'])
+            score_text = None
+            if objects['scored'][i]:
+                score_text = f"IoU:{objects['predicted_iou'][i]:.2f} S:{objects['stability_score'][i]:.2f}"
+            annotations.append((obj_id, center_x, center_y, score_text))
+        
+        if label is not None:
+            # Blend the colors into the masked pixels at 30% opacity
+            x0, y0, x1, y1 = painted
+            label_roi = label[y0:y1, x0:x1]
+            roi = overlay[y0:y1, x0:x1]
+            blended = cv2.addWeighted(roi, 0.7, palette[label_roi], 0.3, 0)
+            np.copyto(roi, blended, where=(label_roi > 0)[..., None])
+        
+        for obj_id, center_x, center_y, score_text in annotations:
+            # Add object ID
+            _stamp_text(overlay, f"ID:{obj_id}", (center_x, center_y), 0.6, (255, 255, 255), 2)
+            
+            # Add quality scores (smaller text)
+            if score_text:
+                cv2.putText(overlay, score_text, (center_x, center_y + 20), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1, cv2.LINE_8)
+    
+    # Add frame info overlay
+    cv2.putText(overlay, f"Frame: {frame_idx}/{total_frames}", (10, 30), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_8)
+    
+    object_count = len(frame_segmentation.get('object_ids', [])) if frame_segmentation else 0
+    _stamp_text(overlay, f"Objects: {object_count}", (10, 60), 0.7, (255, 255, 255), 2)
+    
+    # Add SAM2 info
+    _stamp_text(overlay, "SAM2 Segmentation", (10, frame.shape[0] - 20), 0.7, (0, 255, 0), 2)
+    
+    return overlay
 
 
 def create_visualization_video(
@@ -42,32 +414,30 @@ def create_visualization_video(
     
     # Get the JPEG folder path (same as video path but without .mp4)
     jpeg_folder_path = video_path.replace('.mp4', '')
-    if not os.path.exists(jpeg_folder_path):
-        raise Exception(f"JPEG folder not found: {jpeg_folder_path}")
     
-    # Get list of JPEG files
-    jpeg_files = [f for f in os.listdir(jpeg_folder_path) if f.endswith('.jpg')]
-    jpeg_files.sort()
+    # Get list of JPEG frames in order; one scandir both checks the folder
+    # and yields each frame's full path
+    try:
+        with os.scandir(jpeg_folder_path) as entries:
+            frame_entries = sorted(
+                (entry for entry in entries if entry.name.endswith('.jpg')),
+                key=lambda entry: entry.name
+            )
+    except (FileNotFoundError, NotADirectoryError):
+        raise Exception(f"JPEG folder not found: {jpeg_folder_path}")
+    frame_paths = [entry.path for entry in frame_entries]
     
-    if not jpeg_files:
+    if not frame_paths:
         raise Exception(f"No JPEG files found in folder: {jpeg_folder_path}")
     
     # Load first frame to get dimensions
-    first_frame_path = os.path.join(jpeg_folder_path, jpeg_files[0])
-    first_frame = cv2.imread(first_frame_path)
+    first_frame = cv2.imread(frame_paths[0])
     height, width = first_frame.shape[:2]
     
     # Create output directory
     output_dir = "data/visualizations"
     os.makedirs(output_dir, exist_ok=True)
     
-    # Create output video (use 30 FPS as default)
-    fps = 30.0
-    output_path = f"{output_dir}/sam2_visualization_{sam2_task_id}.mp4"
-    # Use H.264 codec (avc1) for better browser compatibility
-    fourcc = cv2.VideoWriter_fourcc(*'avc1')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
     # Generate colors for each object
     max_objects = 0
     for seg in segmentation_results:
@@ -75,122 +445,54 @@ def create_visualization_video(
         if isinstance(object_ids, list):
             max_objects = max(max_objects, len(object_ids))
         else:
-            print(f"Warning: object_ids is not a list: {type(object_ids)}")
+            logger.warning(f"object_ids is not a list: {type(object_ids)}")
     
     colors = generate_colors(max_objects + 1)  # +1 for safety
+    # Label 0 is background; object i is painted as label i + 1
+    palette = np.vstack([np.zeros((1, 3), dtype=np.uint8), colors])
+    label_dtype = np.uint8 if len(palette) <= 256 else np.uint16
+    
+    # Index results by frame once; the first result for a frame wins
+    segmentation_by_frame = {}
+    for seg in segmentation_results:
+        segmentation_by_frame.setdefault(seg.get('frame_idx'), seg)
     
     processed_frames = 0
     
-    # Process each JPEG frame
-    for frame_idx, jpeg_file in enumerate(jpeg_files):
-        frame_path = os.path.join(jpeg_folder_path, jpeg_file)
-        frame = cv2.imread(frame_path)
-        
-        if frame is None:
-            continue
-        
-        # Find segmentation results for this frame
-        frame_segmentation = None
-        for seg in segmentation_results:
-            if seg.get('frame_idx') == frame_idx:
-                frame_segmentation = seg
-                break
-        
-        # Create overlay frame
-        overlay = frame.copy()
-        
-        if frame_segmentation:
-            object_ids = frame_segmentation.get('object_ids', [])
-            masks = frame_segmentation.get('masks', [])
-            
-            # Ensure object_ids and masks are lists
-            if not isinstance(object_ids, list):
-                print(f"Warning: object_ids is not a list: {type(object_ids)}")
-                object_ids = []
-            if not isinstance(masks, list):
-                print(f"Warning: masks is not a list: {type(masks)}")
-                masks = []
-            
-            # Apply masks with colors
-            for i, (obj_id, mask_data) in enumerate(zip(object_ids, masks)):
-                if i < len(colors):
-                    color = colors[i]
-                    
-                    # Extract segmentation mask - handle both MaskData objects and dict format
-                    if hasattr(mask_data, 'segmentation'):
-                        # MaskData object
-                        mask_array = np.array(mask_data.segmentation, dtype=np.uint8)
-                        area = mask_data.area
-                        bbox = mask_data.bbox
-                        predicted_iou = mask_data.predicted_iou
-                        stability_score = mask_data.stability_score
-                    elif isinstance(mask_data, dict):
-                        # Dictionary format
-                        mask_array = np.array(mask_data['segmentation'], dtype=np.uint8)
-                        area = mask_data.get('area', 0)
-                        bbox = mask_data.get('bbox', [0, 0, 0, 0])
-                        predicted_iou = mask_data.get('predicted_iou', 0.0)
-                        stability_score = mask_data.get('stability_score', 0.0)
-                    else:
-                        # Fallback for old format (raw arrays)
-                        mask_array = np.array(mask_data, dtype=np.uint8)
-                        area = np.sum(mask_array > 0)
-                        bbox = [0, 0, 0, 0]
-                        predicted_iou = 0.0
-                        stability_score = 0.0
-                    
-                    # Resize mask to match frame dimensions if needed
-                    if mask_array.shape[:2] != frame.shape[:2]:
-                        print(f"Resizing mask from {mask_array.shape[:2]} to {frame.shape[:2]}")
-                        mask_array = cv2.resize(mask_array, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_NEAREST)
-                    
-                    # Create colored overlay
-                    colored_mask = np.zeros_like(overlay)
-                    colored_mask[mask_array > 0] = color
-                    
-                    # Blend with original frame (30% opacity for colored masks)
-                    overlay = cv2.addWeighted(overlay, 0.7, colored_mask, 0.3, 0)
-                    
-                    # Add object ID and info text
-                    if np.any(mask_array > 0):
-                        # Find center of mask
-                        y_coords, x_coords = np.where(mask_array > 0)
-                        if len(y_coords) > 0:
-                            center_y, center_x = int(np.mean(y_coords)), int(np.mean(x_coords))
-                            
-                            # Add object ID
-                            cv2.putText(overlay, f"ID:{obj_id}", (center_x, center_y), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                            
-                            # Add quality scores (smaller text)
-                            if isinstance(mask_data, dict):
-                                score_text = f"IoU:{predicted_iou:.2f} S:{stability_score:.2f}"
-                                cv2.putText(overlay, score_text, (center_x, center_y + 20), 
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
-        
-        # Add frame info overlay
-        cv2.putText(overlay, f"Frame: {frame_idx}/{len(jpeg_files)}", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        object_count = len(frame_segmentation.get('object_ids', [])) if frame_segmentation else 0
-        cv2.putText(overlay, f"Objects: {object_count}", (10, 60), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        # Add SAM2 info
-        cv2.putText(overlay, "SAM2 Segmentation", (10, height - 20), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        
-        out.write(overlay)
-        processed_frames += 1
+    # Frames are independent: their bytes are read ahead on I/O threads, then
+    # decoded and drawn on worker threads and written to the video in order
+    def render(indexed_bytes: Tuple[int, Optional[bytes]]) -> Optional[np.ndarray]:
+        frame_idx, frame_bytes = indexed_bytes
+        return _render_frame(frame_bytes, frame_idx, len(frame_paths), segmentation_by_frame.get(frame_idx),
+                             colors, palette, label_dtype)
+    
+    # Create output video (use 30 FPS as default)
+    fps = 30.0
+    output_path = f"{output_dir}/sam2_visualization_{sam2_task_id}.mp4"
+    out = _open_video_writer(output_path, fps, width, height)
     
-    out.release()
+    # A failed render must not leave ffmpeg running or a truncated video behind
+    completed = False
+    try:
+        frame_bytes = _map_ahead(_read_file, frame_paths, _file_reader, READ_AHEAD)
+        for overlay in _map_ahead(render, enumerate(frame_bytes)):
+            if overlay is None:
+                continue
+            out.write(overlay)
+            processed_frames += 1
+        
+        out.release()
+        completed = True
+    finally:
+        if not completed:
+            _discard_video_writer(out, output_path)
     
     return {
         "visualization_path": f"/static/visualizations/sam2_visualization_{sam2_task_id}.mp4",
         "local_path": output_path,
         "original_video": video_path,
         "jpeg_folder": jpeg_folder_path,
-        "total_frames": len(jpeg_files),
+        "total_frames": len(frame_paths),
         "processed_frames": processed_frames,
         "segmentation_results": len(segmentation_results),
         "sam2_task_id": sam2_task_id
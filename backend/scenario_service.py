@@ -1,9 +1,9 @@
 import os
-import uuid
 from datetime import datetime
 from typing import List, Dict
 from models import Scenario, Scene, Episode
-from video_utils import get_video_info
+from video_utils import get_videos_info
+from utils.logging import logger
 
 # Global storage for scenarios, scenes, episodes and annotations
 scenarios_db: Dict[str, Scenario] = {}
@@ -11,42 +11,49 @@ annotations_db: List[dict] = []
 
 def scan_video_directory():
     """Scan the videos directory and build scenarios/scenes/episodes structure"""
-    # Clear existing data
-    scenarios_db.clear()
-    
     videos_dir = "data/videos"
     scenarios = []
+    # One timestamp for the whole scan rather than a clock read per object
+    scanned_at = datetime.now()
     
     if not os.path.exists(videos_dir):
-        print(f"Videos directory {videos_dir} not found")
+        logger.warning(f"Videos directory {videos_dir} not found")
         return scenarios
     
     # Step 1: Get list of scenarios
-    scenario_names = []
-    for item in os.listdir(videos_dir):
-        item_path = os.path.join(videos_dir, item)
-        if os.path.isdir(item_path):
-            scenario_names.append(item)
+    # os.scandir types each entry from the listing, without a stat per entry
+    with os.scandir(videos_dir) as entries:
+        scenario_names = [entry.name for entry in entries if entry.is_dir()]
     
     
     # Step 2: For each scenario, get list of scenes
     for scenario_name in scenario_names:
         scenario_path = os.path.join(videos_dir, scenario_name)
+        scenario_title = scenario_name.replace('_', ' ').title()
         scenes = []
         total_scenario_duration = 0
         total_scenario_episodes = 0
         
         # Step 3: Get scenes (subdirectories of scenario)
-        for scene_item in os.listdir(scenario_path):
-            scene_path = os.path.join(scenario_path, scene_item)
-            if os.path.isdir(scene_path):
+        with os.scandir(scenario_path) as entries:
+            scenario_entries = list(entries)
+        for scene_entry in scenario_entries:
+            scene_item = scene_entry.name
+            scene_path = scene_entry.path
+            if scene_entry.is_dir():
                 # This is a scene directory (e.g., real_ur5_1, real_ur5_2, real_ur5_3)
                 episodes = []
                 scene_duration = 0
                 
                 # Step 4: Get episodes (directories in scene directory)
-                scene_items = os.listdir(scene_path)
-                episode_dirs = [item for item in scene_items if os.path.isdir(os.path.join(scene_path, item))]
+                with os.scandir(scene_path) as entries:
+                    scene_entries = list(entries)
+                episode_dirs = [entry.name for entry in scene_entries if entry.is_dir()]
+                scene_items = {entry.name for entry in scene_entries}
+                
+                # Probe the scene's MP4s together rather than one after another
+                mp4_paths = [os.path.join(scene_path, f"{item}.mp4") for item in episode_dirs if f"{item}.mp4" in scene_items]
+                video_infos = dict(zip(mp4_paths, get_videos_info(mp4_paths)))
                 
                 for episode_dir in episode_dirs:
                     episode_id = episode_dir  # Episode ID is the directory name (e.g., "0", "1", "2")
@@ -54,9 +61,9 @@ def scan_video_directory():
                     mp4_path = os.path.join(scene_path, mp4_filename)
                     
                     # Check if the corresponding MP4 file exists
-                    if os.path.exists(mp4_path):
+                    if mp4_filename in scene_items:
                         # Get video metadata
-                        video_info = get_video_info(mp4_path)
+                        video_info = video_infos[mp4_path]
                         if video_info:
                             episode_duration = video_info['duration']
                             fps = video_info['fps']
@@ -80,7 +87,7 @@ def scan_video_directory():
                             fps=fps,
                             width=width,
                             height=height,
-                            created_at=datetime.now(),
+                            created_at=scanned_at,
                             description=f"Episode {episode_id} from scene {scene_item}"
                         )
                         episodes.append(episode)
@@ -92,10 +99,10 @@ def scan_video_directory():
                         id=scene_item,
                         scenario_id=scenario_name,
                         name=scene_item,
-                        description=f"Scene {scene_item} from {scenario_name.replace('_', ' ').title()}",
+                        description=f"Scene {scene_item} from {scenario_title}",
                         episode_count=len(episodes),
                         total_duration=scene_duration,
-                        created_at=datetime.now(),
+                        created_at=scanned_at,
                         episodes=episodes
                     )
                     scenes.append(scene)
@@ -106,16 +113,20 @@ def scan_video_directory():
         if scenes:
             scenario = Scenario(
                 id=scenario_name,
-                name=scenario_name.replace('_', ' ').title(),
-                description=f"Dataset for {scenario_name.replace('_', ' ').title()}",
+                name=scenario_title,
+                description=f"Dataset for {scenario_title}",
                 scene_count=len(scenes),
                 total_episodes=total_scenario_episodes,
                 total_duration=total_scenario_duration,
-                created_at=datetime.now(),
+                created_at=scanned_at,
                 scenes=scenes
             )
             scenarios.append(scenario)
-            scenarios_db[scenario_name] = scenario
+    
+    # Swap the results in at the end so readers never see a half-built scan
+    new_scenarios = {scenario.id: scenario for scenario in scenarios}
+    scenarios_db.clear()
+    scenarios_db.update(new_scenarios)
     
     return scenarios
 
@@ -3,14 +3,30 @@ AWS S3 service for cloud storage operations.
 """
 import os
 import logging
-from typing import Optional, BinaryIO, List
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, BinaryIO, List, Set, Tuple
 from pathlib import Path
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
 from config import settings
 
+try:
+    from botocore.exceptions import ClientError, NoCredentialsError
+except ImportError:  # boto3 is only required for STORAGE_MODE=s3
+    ClientError = NoCredentialsError = Exception
+
 logger = logging.getLogger(__name__)
 
+# Files above this size go up and down as parallel 8 MB parts
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+# Files moved at once by upload_files/download_files
+BATCH_TRANSFER_WORKERS = 8
+# file_exists answers from one listing per key prefix, kept this long so keys
+# written by other processes show up; least recently used prefixes are dropped
+PREFIX_CACHE_TTL = 30.0
+PREFIX_CACHE_SIZE = 128
+
 
 class S3Service:
     """Service for AWS S3 operations."""
@@ -18,15 +34,41 @@ class S3Service:
     def __init__(self):
         """Initialize S3 service."""
         self.s3_client = None
+        self.transfer_config = None
         self.bucket_name = settings.s3_bucket_name
+        # prefix -> (listed at, keys under the prefix)
+        self._prefix_cache: "OrderedDict[str, Tuple[float, Set[str]]]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+        # prefix -> count of this process's writes under it, and a count of
+        # invalidations; a listing that overlapped either is not trusted
+        self._prefix_generations: Dict[str, int] = {}
+        self._invalidations = 0
         
         if settings.storage_mode == "s3" and self.bucket_name:
             try:
+                # Imported here so local-storage deployments never pay for boto3
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+                from botocore.config import Config
+                # One client for the process; its pool keeps connections alive
+                # across uploads from concurrent task workers
                 self.s3_client = boto3.client(
                     's3',
                     aws_access_key_id=settings.aws_access_key_id,
                     aws_secret_access_key=settings.aws_secret_access_key,
-                    region_name=settings.aws_region
+                    region_name=settings.aws_region,
+                    config=Config(
+                        max_pool_connections=settings.s3_max_pool_connections,
+                        tcp_keepalive=True,
+                        retries={'mode': 'adaptive'}
+                    )
+                )
+                # Multipart parts of one file share the client's connection pool
+                self.transfer_config = TransferConfig(
+                    multipart_threshold=MULTIPART_CHUNK_SIZE,
+                    multipart_chunksize=MULTIPART_CHUNK_SIZE,
+                    max_concurrency=min(16, settings.s3_max_pool_connections),
+                    use_threads=True
                 )
                 logger.info(f"S3 service initialized for bucket: {self.bucket_name}")
             except NoCredentialsError:
@@ -56,7 +98,8 @@ class S3Service:
             return False
         
         try:
-            self.s3_client.upload_file(local_file_path, self.bucket_name, s3_key)
+            self.s3_client.upload_file(local_file_path, self.bucket_name, s3_key, Config=self.transfer_config)
+            self._remember_key(s3_key, exists=True)
             logger.info(f"Uploaded {local_file_path} to s3://{self.bucket_name}/{s3_key}")
             return True
         except ClientError as e:
@@ -66,6 +109,33 @@ class S3Service:
             logger.error(f"Unexpected error uploading to S3: {e}")
             return False
     
+    def upload_fileobj(self, fileobj: BinaryIO, s3_key: str) -> bool:
+        """
+        Upload a file-like object to S3.
+        
+        Args:
+            fileobj: Readable binary file-like object
+            s3_key: S3 object key
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        if not self.is_available():
+            logger.warning("S3 service not available")
+            return False
+        
+        try:
+            self.s3_client.upload_fileobj(fileobj, self.bucket_name, s3_key, Config=self.transfer_config)
+            self._remember_key(s3_key, exists=True)
+            logger.info(f"Uploaded object to s3://{self.bucket_name}/{s3_key}")
+            return True
+        except ClientError as e:
+            logger.error(f"Failed to upload file to S3: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error uploading to S3: {e}")
+            return False
+    
     def download_file(self, s3_key: str, local_file_path: str) -> bool:
         """
         Download a file from S3.
@@ -85,7 +155,7 @@ class S3Service:
             # Ensure directory exists
             os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
             
-            self.s3_client.download_file(self.bucket_name, s3_key, local_file_path)
+            self.s3_client.download_file(self.bucket_name, s3_key, local_file_path, Config=self.transfer_config)
             logger.info(f"Downloaded s3://{self.bucket_name}/{s3_key} to {local_file_path}")
             return True
         except ClientError as e:
@@ -95,6 +165,37 @@ class S3Service:
             logger.error(f"Unexpected error downloading from S3: {e}")
             return False
     
+    def upload_files(self, pairs: List[Tuple[str, str]]) -> List[bool]:
+        """
+        Upload several files to S3 concurrently.
+        
+        Args:
+            pairs: (local file path, S3 object key) for each file
+            
+        Returns:
+            Whether each upload succeeded, in the order given
+        """
+        return self._transfer_all(self.upload_file, pairs)
+    
+    def download_files(self, pairs: List[Tuple[str, str]]) -> List[bool]:
+        """
+        Download several files from S3 concurrently.
+        
+        Args:
+            pairs: (S3 object key, local file path) for each file
+            
+        Returns:
+            Whether each download succeeded, in the order given
+        """
+        return self._transfer_all(self.download_file, pairs)
+    
+    def _transfer_all(self, transfer, pairs: List[Tuple[str, str]]) -> List[bool]:
+        """Run transfer(a, b) for every pair on a short-lived thread pool."""
+        if len(pairs) <= 1:
+            return [transfer(a, b) for a, b in pairs]
+        with ThreadPoolExecutor(max_workers=min(BATCH_TRANSFER_WORKERS, len(pairs))) as executor:
+            return list(executor.map(lambda pair: transfer(*pair), pairs))
+    
     def get_file_url(self, s3_key: str, expiration: int = 3600) -> Optional[str]:
         """
         Generate a presigned URL for a file.
@@ -136,14 +237,11 @@ class S3Service:
             return []
         
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
-            
+            # list_objects_v2 returns at most 1000 keys per call
+            paginator = self.s3_client.get_paginator('list_objects_v2')
             files = []
-            if 'Contents' in response:
-                files = [obj['Key'] for obj in response['Contents']]
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                files.extend(obj['Key'] for obj in page.get('Contents', []))
             
             logger.info(f"Listed {len(files)} files with prefix: {prefix}")
             return files
@@ -167,6 +265,7 @@ class S3Service:
         
         try:
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
+            self._remember_key(s3_key, exists=False)
             logger.info(f"Deleted s3://{self.bucket_name}/{s3_key}")
             return True
         except ClientError as e:
@@ -186,11 +285,74 @@ class S3Service:
         if not self.is_available():
             return False
         
+        prefix = s3_key[:s3_key.rfind('/') + 1]
+        keys = self._prefix_keys(prefix)
+        if keys is not None:
+            return s3_key in keys
+        
         try:
             self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
             return True
         except ClientError:
             return False
+    
+    def _prefix_keys(self, prefix: str) -> Optional[Set[str]]:
+        """Keys directly under prefix, from the cache or one paginated listing; None if listing fails or raced a write."""
+        now = time.monotonic()
+        with self._prefix_lock:
+            cached = self._prefix_cache.get(prefix)
+            if cached is not None and now - cached[0] < PREFIX_CACHE_TTL:
+                self._prefix_cache.move_to_end(prefix)
+                return cached[1]
+            generation = (self._prefix_generations.get(prefix, 0), self._invalidations)
+        
+        try:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            keys = set()
+            # Delimiter keeps the listing to this level rather than every nested key
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+                keys.update(obj['Key'] for obj in page.get('Contents', []))
+        except ClientError as e:
+            logger.warning(f"Failed to list S3 prefix {prefix!r}, falling back to head_object: {e}")
+            return None
+        
+        with self._prefix_lock:
+            # A key written or deleted while the pages were fetched may be
+            # missing from them; let head_object answer until the next listing
+            if (self._prefix_generations.get(prefix, 0), self._invalidations) != generation:
+                return None
+            self._prefix_cache[prefix] = (now, keys)
+            self._prefix_cache.move_to_end(prefix)
+            while len(self._prefix_cache) > PREFIX_CACHE_SIZE:
+                self._prefix_cache.popitem(last=False)
+        return keys
+    
+    def _remember_key(self, s3_key: str, exists: bool):
+        """Reflect this process's own upload or delete in a cached listing."""
+        prefix = s3_key[:s3_key.rfind('/') + 1]
+        with self._prefix_lock:
+            self._prefix_generations[prefix] = self._prefix_generations.get(prefix, 0) + 1
+            cached = self._prefix_cache.get(prefix)
+            if cached is not None:
+                if exists:
+                    cached[1].add(s3_key)
+                else:
+                    cached[1].discard(s3_key)
+    
+    def invalidate(self, prefix: Optional[str] = None):
+        """
+        Drop cached listings used by file_exists.
+        
+        Args:
+            prefix: Only drop listings under this prefix; all of them if None
+        """
+        with self._prefix_lock:
+            self._invalidations += 1
+            if prefix is None:
+                self._prefix_cache.clear()
+            else:
+                for cached_prefix in [p for p in self._prefix_cache if p.startswith(prefix)]:
+                    del self._prefix_cache[cached_prefix]
 
 
 # Global S3 service instance
@@ -3,14 +3,15 @@ SAM2 AI service for video segmentation.
 """
 import logging
 import os
+from functools import partial
 from typing import Dict, Any, Optional
 import asyncio
 import time
 
-from config import settings
 from utils.logging import logger
 from exceptions import SAM2Error, ServiceUnavailableError
 from models import TaskStatus, ProcessingResult, SegmentationResult, MaskData, ObjectTracking
+from services.task_manager import task_manager
 
 
 class SAM2Service:
@@ -24,6 +25,7 @@ class SAM2Service:
         self.device = None
         self.initialized = False
         self.mask_generator_available = False
+        self._video_processing_task = None
         logger.info("SAM2 service initialized")
     
     async def initialize(self):
@@ -31,47 +33,31 @@ class SAM2Service:
         try:
             logger.info("Loading SAM2 model...")
             
-            # Check if SAM2 is installed
+            # sam2hiera_service loads the model on import, with bf16 autocast,
+            # inference mode and torch.compile set up for its forward passes.
+            # That instance is the one tasks run on, so share it rather than
+            # loading a second, unoptimized copy here.
             try:
-                from sam2.sam2_video_predictor import SAM2VideoPredictor
-                from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
-                import torch
+                import sam2hiera_service
             except ImportError as e:
                 logger.warning(f"SAM2 not installed: {e}")
                 logger.info("SAM2 service will be disabled")
                 return
             
-            # Determine device
-            if settings.sam2_device == "auto":
-                self.device = "cpu" if not torch.cuda.is_available() else "cuda"
-            else:
-                self.device = settings.sam2_device
+            ai_model = sam2hiera_service.ai_model
+            if ai_model is None or not ai_model.model_available:
+                logger.warning("SAM2 model failed to load")
+                logger.info("SAM2 service will be disabled")
+                return
             
+            self.device = ai_model.device
             logger.info(f"Using device: {self.device}")
             
-            # Load video predictor using the working method
-            self.predictor = SAM2VideoPredictor.from_pretrained("facebook/sam2-hiera-tiny", device=self.device)
-            self.model = self.predictor
-            
-            logger.info("SAM2 model loaded successfully")
-            
-            # Initialize automatic mask generator
-            try:
-                self.mask_generator = SAM2AutomaticMaskGenerator(
-                    model=self.model,
-                    points_per_side=32,
-                    pred_iou_thresh=0.86,
-                    stability_score_thresh=0.92,
-                    crop_n_layers=1,
-                    crop_n_points_downscale_factor=2,
-                    min_mask_region_area=100,
-                )
-                logger.info("SAM2 automatic mask generator initialized successfully")
-                self.mask_generator_available = True
-            except Exception as e:
-                logger.warning(f"Could not initialize automatic mask generator: {e}")
-                self.mask_generator = None
-                self.mask_generator_available = False
+            self.predictor = ai_model.predictor
+            self.model = ai_model.model
+            self.mask_generator = ai_model.mask_generator
+            self.mask_generator_available = ai_model.mask_generator_available
+            self._video_processing_task = sam2hiera_service._sam2_video_processing_task
             
             self.initialized = True
             logger.info("SAM2 service initialized successfully")
@@ -109,21 +95,37 @@ class SAM2Service:
             logger.info(f"Processing video: {video_path}")
             start_time = time.time()
             
-            # Use the working logic from sam2hiera_service.py
-            from sam2hiera_service import _sam2_video_processing_task
+            # Progress arrives from the worker thread; TaskManager is thread-safe.
+            # Ticks are coalesced to at most 4 Hz unless progress moved by 1%.
+            last_reported = {"time": 0.0, "progress": -1.0}
             
-            # Create a simple progress callback function
             def progress_callback(progress: float):
+                now = time.monotonic()
+                if (progress < 1.0
+                    and now - last_reported["time"] < 0.25
+                    and progress - last_reported["progress"] < 0.01):
+                    return
+                last_reported["time"] = now
+                last_reported["progress"] = progress
+                
                 logger.info(f"Processing progress: {progress:.1%}")
-            
-            # Process video using the existing working implementation
-            # Arguments: task_id, progress_callback, relative_video_path, prompts, mode
-            result = _sam2_video_processing_task(
-                task_id=task_id or f"sam2_task_{int(time.time())}", 
-                progress_callback=progress_callback, 
-                relative_video_path=video_path, 
-                prompts=prompts, 
-                mode=mode
+                if task_id:
+                    task_manager.update_task_status(task_id, TaskStatus.RUNNING, progress=progress)
+            
+            # SAM2 inference is synchronous and runs for the length of the
+            # video, so keep it off the event loop. A thread (rather than a
+            # process) pool lets every task share the already-loaded model.
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                task_manager.executor,
+                partial(
+                    self._video_processing_task,
+                    task_id=task_id or f"sam2_task_{int(time.time())}",
+                    progress_callback=progress_callback,
+                    relative_video_path=video_path,
+                    prompts=prompts,
+                    mode=mode
+                )
             )
             
             processing_time = time.time() - start_time
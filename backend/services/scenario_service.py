@@ -1,17 +1,40 @@
 """
 Scenario service for managing robotics data scenarios.
 """
+import builtins
 import os
 import logging
-import random
-from typing import List, Dict, Any, Optional
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pathlib import Path
 
+import orjson
+
 from config import settings
 from utils.logging import logger
 from models import Scenario, Scene, Episode
 from exceptions import FileNotFoundError, ValidationError
 
+# Matched against the lowercased text from a name's last dot, as os.path.splitext
+# would split it for names that do not start with a dot
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv'})
+FRAME_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+# Episode frame listings kept by get_episode_frames, least recently used dropped first
+FRAMES_CACHE_SIZE = 512
+# Scenario subtrees are independent, so their directory walks overlap on
+# this pool; the work is blocking I/O, not Python
+_scan_pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="scenario-scan")
+# A missing path, or a file where a directory was expected
+_MISSING_DIR_ERRORS = (builtins.FileNotFoundError, NotADirectoryError)
+# Where scandir takes a directory fd and open takes dir_fd, scans open each
+# child relative to its parent instead of resolving the full path again
+_SCAN_BY_FD = os.scandir in os.supports_fd and os.open in os.supports_dir_fd
+_DIR_OPEN_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
+
 # Random physical tasks for scene descriptions
 PHYSICAL_TASKS = [
     "Picking up and placing a small object on a flat counter",
@@ -37,59 +60,213 @@ PHYSICAL_TASKS = [
 ]
 
 
+@lru_cache(maxsize=4096)
+def _display_name(name: str) -> str:
+    """Title-cased display name for a directory name, e.g. real_ur5_1 -> Real Ur5 1."""
+    return name.replace('_', ' ').title()
+
+
 class ScenarioService:
     """Service for managing scenarios, scenes, and episodes."""
     
     def __init__(self):
         """Initialize scenario service."""
         self.videos_dir = Path(settings.videos_dir)
+        # Paths under the videos root are joined as strings on every request
+        self._videos_root = os.fspath(self.videos_dir)
         self.scenarios_cache: Dict[str, Scenario] = {}
+        self.scan_cache_path = Path(settings.data_dir) / "scenarios_cache.json"
+        self._scanned_mtime: Optional[float] = None
+        # scenario_id -> scenario mtime that scenarios_cache[scenario_id] was built from
+        self._scenario_mtimes: Dict[str, float] = {}
+        self._scenario_ids_json: Optional[bytes] = None
+        # scenario_id -> (scenario mtime, scenes)
+        self.scenes_cache: Dict[str, Tuple[float, List[Scene]]] = {}
+        # (scenario_id, scene_id) -> (scene mtime, episodes, episodes by id)
+        self.episodes_cache: Dict[Tuple[str, str], Tuple[float, List[Episode], Dict[str, Episode]]] = {}
+        # episode path -> (episode directory mtime_ns, sorted frame names)
+        self.frames_cache: "OrderedDict[str, Tuple[int, List[str]]]" = OrderedDict()
+        # Frames are listed from the threadpool, and move_to_end/popitem
+        # reorder the cache's links, so every access takes this lock
+        self._frames_lock = threading.Lock()
         logger.info(f"Scenario service initialized with videos directory: {self.videos_dir}")
     
+    def _tree_mtimes(self) -> Tuple[float, Dict[str, float]]:
+        """Latest mtime across the videos root, scenario and scene directories,
+        and the latest mtime of each scenario.
+        
+        Adding or removing a scenario, scene or episode touches one of these
+        directories, so this changes whenever a rescan would find something new.
+        """
+        with os.scandir(self._videos_root) as scenario_entries:
+            scenario_paths = {
+                scenario_entry.name: scenario_entry.path for scenario_entry in scenario_entries
+                if scenario_entry.is_dir() and not scenario_entry.name.startswith('.')
+            }
+        scenario_mtimes = dict(zip(scenario_paths, _scan_pool.map(self._scenario_mtime, scenario_paths.values())))
+        latest = max([os.stat(self._videos_root).st_mtime, *scenario_mtimes.values()])
+        return latest, scenario_mtimes
+    
+    def _scenario_mtime(self, scenario_path: str) -> float:
+        """Latest mtime across a scenario directory and its scene directories."""
+        latest = os.stat(scenario_path).st_mtime
+        with os.scandir(scenario_path) as scene_entries:
+            for scene_entry in scene_entries:
+                if scene_entry.is_dir() and not scene_entry.name.startswith('.'):
+                    latest = max(latest, scene_entry.stat().st_mtime)
+        return latest
+    
+    def _load_scan_cache(self, tree_mtime: float) -> Optional[List[Scenario]]:
+        """Load scenarios from the sidecar cache if it matches the current tree."""
+        try:
+            cached = orjson.loads(self.scan_cache_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        if cached.get("mtime") != tree_mtime:
+            return None
+        try:
+            return [Scenario(**data) for data in cached["scenarios"]]
+        except Exception as e:
+            logger.warning(f"Ignoring invalid scenario scan cache: {e}")
+            return None
+    
+    def _save_scan_cache(self, tree_mtime: float, scenarios: List[Scenario]):
+        """Atomically write the scan result to the sidecar cache."""
+        payload = orjson.dumps({
+            "mtime": tree_mtime,
+            "scenarios": [scenario.model_dump() for scenario in scenarios]
+        })
+        tmp_path = self.scan_cache_path.with_name(self.scan_cache_path.name + ".tmp")
+        try:
+            self.scan_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, payload)
+            finally:
+                os.close(fd)
+            # Another worker reading the cache never sees a half-written file
+            os.replace(tmp_path, self.scan_cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to write scenario scan cache: {e}")
+    
     def scan_video_directory(self) -> List[Scenario]:
-        """Scan video directory and build scenario hierarchy."""
+        """Scan video directory and build scenario hierarchy.
+        
+        The full walk is skipped when the directory tree is unchanged since the
+        last scan, either in this process or as recorded in the sidecar cache.
+        Otherwise only scenarios whose directories changed are rebuilt.
+        """
         if not self.videos_dir.exists():
             logger.warning(f"Videos directory does not exist: {self.videos_dir}")
             return []
         
-        scenarios = []
-        logger.info("Scanning video directory for scenarios...")
-        
         try:
-            # Scan for scenarios (top-level directories)
-            for scenario_dir in self.videos_dir.iterdir():
-                if scenario_dir.is_dir() and not scenario_dir.name.startswith('.'):
-                    scenario = self._build_scenario(scenario_dir)
+            tree_mtime, scenario_mtimes = self._tree_mtimes()
+            if tree_mtime == self._scanned_mtime:
+                return list(self.scenarios_cache.values())
+            
+            scenarios = self._load_scan_cache(tree_mtime)
+            if scenarios is not None:
+                logger.info(f"Loaded {len(scenarios)} scenarios from scan cache")
+            else:
+                scenarios = []
+                logger.info("Scanning video directory for scenarios...")
+                
+                # Scan for scenarios (top-level directories), reusing unchanged
+                # ones and building the rest concurrently
+                changed = [
+                    scenario_id for scenario_id, scenario_mtime in scenario_mtimes.items()
+                    if scenario_id not in self.scenarios_cache
+                    or self._scenario_mtimes.get(scenario_id) != scenario_mtime
+                ]
+                built = dict(zip(changed, _scan_pool.map(
+                    self._build_scenario, [os.path.join(self._videos_root, scenario_id) for scenario_id in changed]
+                )))
+                for scenario_id in scenario_mtimes:
+                    scenario = built[scenario_id] if scenario_id in built else self.scenarios_cache[scenario_id]
                     if scenario:
                         scenarios.append(scenario)
-                        self.scenarios_cache[scenario.id] = scenario
+                
+                logger.info(f"Found {len(scenarios)} scenarios")
+                self._save_scan_cache(tree_mtime, scenarios)
             
-            logger.info(f"Found {len(scenarios)} scenarios")
+            self.scenarios_cache = {scenario.id: scenario for scenario in scenarios}
+            self._scenario_mtimes = scenario_mtimes
+            self._scenario_ids_json = None
+            self._scanned_mtime = tree_mtime
             return scenarios
             
         except Exception as e:
             logger.error(f"Failed to scan video directory: {e}")
             raise FileNotFoundError(f"Failed to scan video directory: {str(e)}")
     
-    def _build_scenario(self, scenario_dir: Path) -> Optional[Scenario]:
+    def warmup(self) -> List[Scenario]:
+        """Scan the video tree and prime every per-scenario cache.
+        
+        Run once at startup so the first requests find scenes and the
+        encoded scenario ids ready instead of each walking the tree.
+        """
+        scenarios = self.scan_video_directory()
+        for scenario in scenarios:
+            try:
+                self.get_scenes(scenario.id)
+            except FileNotFoundError as e:
+                logger.warning(f"Skipping scene warm-up for {scenario.id}: {e}")
+        self.get_scenario_ids_json()
+        return scenarios
+    
+    @staticmethod
+    def _subdirs(path) -> List[os.DirEntry]:
+        """Visible subdirectories of a directory, typed from the directory listing itself."""
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+    
+    @staticmethod
+    def _count_subdirs(path: Union[str, int]) -> int:
+        """Number of visible subdirectories of a directory path or open directory fd, without building a list."""
+        with os.scandir(path) as entries:
+            return sum(1 for entry in entries if entry.is_dir() and not entry.name.startswith('.'))
+    
+    def _count_scenes_episodes(self, scenario_path: str) -> Tuple[int, int]:
+        """(scene count, episode count) of a scenario in one two-level scandir walk."""
+        total_scenes = 0
+        total_episodes = 0
+        if not _SCAN_BY_FD:
+            with os.scandir(scenario_path) as scene_entries:
+                for scene_entry in scene_entries:
+                    if scene_entry.is_dir() and not scene_entry.name.startswith('.'):
+                        total_scenes += 1
+                        total_episodes += self._count_subdirs(scene_entry.path)
+            return total_scenes, total_episodes
+        
+        scenario_fd = os.open(scenario_path, _DIR_OPEN_FLAGS)
+        try:
+            with os.scandir(scenario_fd) as scene_entries:
+                for scene_entry in scene_entries:
+                    if scene_entry.is_dir() and not scene_entry.name.startswith('.'):
+                        total_scenes += 1
+                        scene_fd = os.open(scene_entry.name, _DIR_OPEN_FLAGS, dir_fd=scenario_fd)
+                        try:
+                            total_episodes += self._count_subdirs(scene_fd)
+                        finally:
+                            os.close(scene_fd)
+        finally:
+            os.close(scenario_fd)
+        return total_scenes, total_episodes
+    
+    def _build_scenario(self, scenario_dir: str) -> Optional[Scenario]:
         """Build scenario from directory."""
         try:
-            scenario_id = scenario_dir.name
-            total_scenes = 0
-            total_episodes = 0
+            scenario_id = os.path.basename(scenario_dir)
             
             # Count scenes and episodes
-            for item in scenario_dir.iterdir():
-                if item.is_dir() and not item.name.startswith('.'):
-                    total_scenes += 1
-                    # Count episodes in scene
-                    for episode_item in item.iterdir():
-                        if episode_item.is_dir() and not episode_item.name.startswith('.'):
-                            total_episodes += 1
+            total_scenes, total_episodes = self._count_scenes_episodes(scenario_dir)
             
-            scenario = Scenario(
+            # Every field is built here from directory names and counts, so
+            # the model is constructed without re-validating them
+            scenario = Scenario.model_construct(
                 id=scenario_id,
-                name=scenario_id.replace('_', ' ').title(),
+                name=_display_name(scenario_id),
                 description=f"Robotics scenario: {scenario_id}",
                 total_scenes=total_scenes,
                 total_episodes=total_episodes
@@ -107,6 +284,14 @@ class ScenarioService:
             self.scan_video_directory()
         return list(self.scenarios_cache.values())
     
+    def get_scenario_ids_json(self) -> bytes:
+        """Get scenario IDs as a JSON array, encoded once per scan result."""
+        if not self.scenarios_cache:
+            self.scan_video_directory()
+        if self._scenario_ids_json is None:
+            self._scenario_ids_json = orjson.dumps(list(self.scenarios_cache))
+        return self._scenario_ids_json
+    
     def get_scenario(self, scenario_id: str) -> Optional[Scenario]:
         """Get scenario by ID."""
         if scenario_id not in self.scenarios_cache:
@@ -116,88 +301,140 @@ class ScenarioService:
         return self.scenarios_cache.get(scenario_id)
     
     def get_scenes(self, scenario_id: str) -> List[Scene]:
-        """Get scenes for a scenario."""
-        scenario_dir = self.videos_dir / scenario_id
-        if not scenario_dir.exists():
-            raise FileNotFoundError(f"Scenario not found: {scenario_id}")
+        """Get scenes for a scenario.
+        
+        Scenes are cached per scenario and rebuilt only when the scenario or
+        one of its scene directories changes. Callers may rely on getting the
+        same list object back while nothing changed.
+        """
+        scenario_dir = os.path.join(self._videos_root, scenario_id)
         
         scenes = []
         try:
-            for scene_dir in scenario_dir.iterdir():
-                if scene_dir.is_dir() and not scene_dir.name.startswith('.'):
-                    episode_count = 0
-                    for episode_dir in scene_dir.iterdir():
-                        if episode_dir.is_dir() and not episode_dir.name.startswith('.'):
-                            episode_count += 1
-                    
-                    # Assign a random physical task description
-                    task_description = random.choice(PHYSICAL_TASKS)
-                    
-                    scene = Scene(
-                        id=scene_dir.name,
-                        name=scene_dir.name.replace('_', ' ').title(),
-                        scenario_id=scenario_id,
-                        episode_count=episode_count,
-                        description=task_description
-                    )
-                    scenes.append(scene)
+            # The mtime stat doubles as the existence check
+            try:
+                scenario_mtime = self._scenario_mtime(scenario_dir)
+            except _MISSING_DIR_ERRORS:
+                raise FileNotFoundError(f"Scenario not found: {scenario_id}")
+            cached = self.scenes_cache.get(scenario_id)
+            if cached is not None and cached[0] == scenario_mtime:
+                return cached[1]
+            
+            for scene_dir in self._subdirs(scenario_dir):
+                episode_count = self._count_subdirs(scene_dir.path)
+                
+                # Assign a physical task description; hashing the scene's path
+                # gives each scene the same one on every listing and restart
+                scene_key = f"{scenario_id}/{scene_dir.name}".encode()
+                task_description = PHYSICAL_TASKS[zlib.crc32(scene_key) % len(PHYSICAL_TASKS)]
+                
+                scene = Scene.model_construct(
+                    id=scene_dir.name,
+                    name=_display_name(scene_dir.name),
+                    scenario_id=scenario_id,
+                    episode_count=episode_count,
+                    description=task_description
+                )
+                scenes.append(scene)
             
+            self.scenes_cache[scenario_id] = (scenario_mtime, scenes)
             return scenes
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
             logger.error(f"Failed to get scenes for scenario {scenario_id}: {e}")
             raise FileNotFoundError(f"Failed to get scenes: {str(e)}")
     
     def get_episodes(self, scenario_id: str, scene_id: str) -> List[Episode]:
         """Get episodes for a scene."""
-        scene_dir = self.videos_dir / scenario_id / scene_id
-        if not scene_dir.exists():
-            raise FileNotFoundError(f"Scene not found: {scenario_id}/{scene_id}")
+        return self._scene_episodes(scenario_id, scene_id)[0]
+    
+    def _scene_episodes(self, scenario_id: str, scene_id: str) -> Tuple[List[Episode], Dict[str, Episode]]:
+        """Get a scene's episodes as a list and indexed by id.
+        
+        Both are cached per scene and rebuilt only when the scene directory
+        changes, which adding or removing a video always does.
+        """
+        scene_dir = os.path.join(self._videos_root, scenario_id, scene_id)
         
         episodes = []
         try:
+            # The mtime stat doubles as the existence check
+            try:
+                scene_mtime = os.stat(scene_dir).st_mtime
+            except builtins.FileNotFoundError:
+                raise FileNotFoundError(f"Scene not found: {scenario_id}/{scene_id}")
+            cached = self.episodes_cache.get((scenario_id, scene_id))
+            if cached is not None and cached[0] == scene_mtime:
+                return cached[1], cached[2]
+            
             # Look for video files directly in the scene directory
-            for file in scene_dir.iterdir():
-                if file.is_file() and file.suffix.lower() in ['.mp4', '.avi', '.mov', '.mkv']:
-                    episode_id = file.stem  # episode_0.mp4 -> episode_0
-                    episode = Episode(
-                        id=episode_id,
-                        name=episode_id.replace('_', ' ').title(),
-                        scenario_id=scenario_id,
-                        scene_id=scene_id,
-                        file_path=str(file.relative_to(self.videos_dir))
-                    )
-                    episodes.append(episode)
+            with os.scandir(scene_dir) as entries:
+                for entry in entries:
+                    name = entry.name
+                    dot = name.rfind('.')
+                    if dot > 0 and name[dot:].lower() in VIDEO_EXTENSIONS and entry.is_file():
+                        episode_id = name[:dot]  # episode_0.mp4 -> episode_0
+                        episode = Episode.model_construct(
+                            id=episode_id,
+                            name=_display_name(episode_id),
+                            scenario_id=scenario_id,
+                            scene_id=scene_id,
+                            file_path=os.path.join(scenario_id, scene_id, entry.name)
+                        )
+                        episodes.append(episode)
             
-            return episodes
+            episodes_by_id = {episode.id: episode for episode in episodes}
+            self.episodes_cache[(scenario_id, scene_id)] = (scene_mtime, episodes, episodes_by_id)
+            return episodes, episodes_by_id
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
             logger.error(f"Failed to get episodes for scene {scenario_id}/{scene_id}: {e}")
             raise FileNotFoundError(f"Failed to get episodes: {str(e)}")
     
     def get_episode(self, episode_id: str, scenario_id: str, scene_id: str) -> Optional[Episode]:
         """Get specific episode."""
-        episodes = self.get_episodes(scenario_id, scene_id)
-        for episode in episodes:
-            if episode.id == episode_id:
-                return episode
-        return None
+        return self._scene_episodes(scenario_id, scene_id)[1].get(episode_id)
     
     def get_episode_frames(self, episode_path: str) -> List[str]:
-        """Get frame files for an episode."""
-        episode_dir = self.videos_dir / episode_path
-        if not episode_dir.exists():
-            raise FileNotFoundError(f"Episode directory not found: {episode_path}")
+        """Get frame files for an episode.
+        
+        Listings are cached per episode and re-read only when the episode
+        directory's mtime changes, which adding or removing a frame does.
+        """
+        episode_dir = os.path.join(self._videos_root, episode_path)
         
-        frames = []
         try:
-            for frame_file in episode_dir.iterdir():
-                if frame_file.is_file() and frame_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                    frames.append(frame_file.name)
+            # The mtime stat doubles as the existence check
+            try:
+                episode_mtime = os.stat(episode_dir).st_mtime_ns
+            except builtins.FileNotFoundError:
+                raise FileNotFoundError(f"Episode directory not found: {episode_path}")
+            with self._frames_lock:
+                cached = self.frames_cache.get(episode_path)
+                if cached is not None and cached[0] == episode_mtime:
+                    self.frames_cache.move_to_end(episode_path)
+                    return cached[1]
             
+            # Listed outside the lock so a large episode does not stall other lookups
+            with os.scandir(episode_dir) as entries:
+                frames = [
+                    entry.name for entry in entries
+                    if os.path.splitext(entry.name)[1].lower() in FRAME_EXTENSIONS and entry.is_file()
+                ]
             frames.sort()
+            with self._frames_lock:
+                self.frames_cache[episode_path] = (episode_mtime, frames)
+                self.frames_cache.move_to_end(episode_path)
+                if len(self.frames_cache) > FRAMES_CACHE_SIZE:
+                    self.frames_cache.popitem(last=False)
             return frames
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
             logger.error(f"Failed to get frames for episode {episode_path}: {e}")
             raise FileNotFoundError(f"Failed to get frames: {str(e)}")
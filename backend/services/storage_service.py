@@ -1,9 +1,10 @@
 """
 Storage service abstraction for local and cloud storage.
 """
+import io
 import os
 import logging
-from typing import Optional, List, BinaryIO
+from typing import Optional, List, BinaryIO, Iterator
 from pathlib import Path
 from abc import ABC, abstractmethod
 
@@ -13,6 +14,20 @@ from services.s3_service import s3_service
 logger = logging.getLogger(__name__)
 
 
+def _walk_files(root: str) -> Iterator[str]:
+    """Yield paths of files under root, recursively, typed from each scandir listing.
+    
+    Like Path.rglob, symlinked directories are not descended into, while
+    symlinks to files are listed.
+    """
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path)
+            elif entry.is_file():
+                yield entry.path
+
+
 class StorageService(ABC):
     """Abstract base class for storage services."""
     
@@ -49,13 +64,15 @@ class LocalStorageService(StorageService):
         """Initialize local storage service."""
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(exist_ok=True)
+        # Per-call paths are joined as strings; Path's / operator costs several times more
+        self._base_str = os.fspath(self.base_dir)
         logger.info(f"Local storage initialized at: {self.base_dir.absolute()}")
     
     def save_file(self, file_path: str, content: bytes) -> bool:
         """Save file content to local storage."""
         try:
-            full_path = self.base_dir / file_path
-            full_path.parent.mkdir(parents=True, exist_ok=True)
+            full_path = os.path.join(self._base_str, file_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
             
             with open(full_path, 'wb') as f:
                 f.write(content)
@@ -68,23 +85,22 @@ class LocalStorageService(StorageService):
     
     def get_file_url(self, file_path: str) -> Optional[str]:
         """Get local file URL."""
-        full_path = self.base_dir / file_path
-        if full_path.exists():
+        if os.path.exists(os.path.join(self._base_str, file_path)):
             return f"/static/{file_path}"
         return None
     
     def file_exists(self, file_path: str) -> bool:
         """Check if file exists in local storage."""
-        return (self.base_dir / file_path).exists()
+        return os.path.exists(os.path.join(self._base_str, file_path))
     
     def delete_file(self, file_path: str) -> bool:
         """Delete file from local storage."""
         try:
-            full_path = self.base_dir / file_path
-            if full_path.exists():
-                full_path.unlink()
-                logger.info(f"Deleted file from local storage: {full_path}")
-                return True
+            full_path = os.path.join(self._base_str, file_path)
+            os.unlink(full_path)
+            logger.info(f"Deleted file from local storage: {full_path}")
+            return True
+        except FileNotFoundError:
             return False
         except Exception as e:
             logger.error(f"Failed to delete file from local storage: {e}")
@@ -93,14 +109,13 @@ class LocalStorageService(StorageService):
     def list_files(self, prefix: str = "") -> List[str]:
         """List files with given prefix in local storage."""
         try:
-            prefix_path = self.base_dir / prefix
+            prefix_path = os.path.join(self._base_str, prefix)
             files = []
             
-            if prefix_path.exists():
-                for file_path in prefix_path.rglob("*"):
-                    if file_path.is_file():
-                        relative_path = file_path.relative_to(self.base_dir)
-                        files.append(str(relative_path))
+            if os.path.isdir(prefix_path):
+                # Entry paths extend the base path, so slicing makes them relative
+                base_length = len(os.path.join(self._base_str, ''))
+                files = [file_path[base_length:] for file_path in _walk_files(prefix_path)]
             
             logger.info(f"Listed {len(files)} files with prefix: {prefix}")
             return files
@@ -115,27 +130,15 @@ class S3StorageService(StorageService):
     def __init__(self, prefix: str = ""):
         """Initialize S3 storage service."""
         self.prefix = prefix
+        self._prefix_len = len(prefix)
         self.s3_service = s3_service
         logger.info(f"S3 storage initialized with prefix: {prefix}")
     
     def save_file(self, file_path: str, content: bytes) -> bool:
         """Save file content to S3."""
         s3_key = f"{self.prefix}{file_path}"
-        
-        # First save to local temp file, then upload
-        temp_path = f"/tmp/{file_path}"
-        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-        
-        try:
-            with open(temp_path, 'wb') as f:
-                f.write(content)
-            
-            success = self.s3_service.upload_file(temp_path, s3_key)
-            os.remove(temp_path)  # Clean up temp file
-            return success
-        except Exception as e:
-            logger.error(f"Failed to save file to S3: {e}")
-            return False
+        # Uploaded straight from memory rather than through a temp file
+        return self.s3_service.upload_fileobj(io.BytesIO(content), s3_key)
     
     def get_file_url(self, file_path: str) -> Optional[str]:
         """Get S3 file URL."""
@@ -156,8 +159,10 @@ class S3StorageService(StorageService):
         """List files with given prefix in S3."""
         full_prefix = f"{self.prefix}{prefix}"
         files = self.s3_service.list_files(full_prefix)
-        # Remove the service prefix from returned file paths
-        return [f[len(self.prefix):] for f in files if f.startswith(self.prefix)]
+        # Remove the service prefix from returned file paths; every key listed
+        # under full_prefix already starts with it
+        prefix_len = self._prefix_len
+        return [f[prefix_len:] for f in files]
 
 
 class StorageManager:
@@ -2,36 +2,377 @@
 Task management service for asynchronous processing.
 """
 import asyncio
+import heapq
 import logging
+import os
+import sqlite3
 import time
-import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
 
+import orjson
+
+from config import settings
 from utils.logging import logger
 from models import TaskInfo, TaskStatus
 from exceptions import TaskError
 
+# Task results hold numpy values and int-keyed object tracking maps
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+TERMINAL_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)
+
+# Finished tasks kept in memory beyond this are evicted oldest-first; they stay
+# in the database and are reloaded on demand by get_task
+MAX_CACHED_TASKS = 1000
+
+# Results hold a whole video's segmentation, so only this many finished tasks
+# keep theirs in memory when a database is available to reload the rest from
+MAX_CACHED_RESULTS = 50
+
+# Number of locks that task_ids are hashed across to serialize updates to one task
+TASK_LOCK_STRIPES = 16
+
+# Progress-only updates are written to the database at most this often per task
+PROGRESS_PERSIST_INTERVAL = 0.5
+
+_TASKS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    started_at REAL,
+    completed_at REAL
+)
+"""
+
+_UPSERT_TASK = """
+INSERT INTO tasks (id, status, progress, result, error, started_at, completed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    status = excluded.status,
+    progress = excluded.progress,
+    result = excluded.result,
+    error = excluded.error,
+    started_at = excluded.started_at,
+    completed_at = excluded.completed_at
+"""
+
+_SELECT_TASKS = "SELECT id, status, progress, result, error, started_at, completed_at FROM tasks"
+
+# Rows shaped like _SELECT_TASKS with a NULL result, for listings. Served from
+# the covering index, so result blobs are never read.
+_SELECT_TASK_SUMMARIES = "SELECT id, status, progress, NULL, error, started_at, completed_at FROM tasks"
+
+_TASK_SUMMARIES_INDEX = """
+CREATE INDEX IF NOT EXISTS tasks_summary
+ON tasks (id, status, progress, error, started_at, completed_at)
+"""
+
+
+class _TaskIdGenerator:
+    """Monotonic ULIDs: a 48-bit millisecond timestamp plus 80 random bits.
+    
+    Random bytes come from a prefetched os.urandom pool, and IDs minted in
+    the same millisecond increment the random part, so IDs sort by creation.
+    """
+    
+    _ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32
+    _POOL_SIZE = 4096
+    
+    def __init__(self):
+        self._lock = Lock()
+        self._pool = os.urandom(self._POOL_SIZE)
+        self._pos = 0
+        self._last_ms = -1
+        self._last_random = 0
+    
+    def new_id(self) -> str:
+        """Return a new 26-character ULID."""
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms <= self._last_ms:
+                now_ms = self._last_ms
+                self._last_random = (self._last_random + 1) & ((1 << 80) - 1)
+            else:
+                if self._pos + 10 > self._POOL_SIZE:
+                    self._pool = os.urandom(self._POOL_SIZE)
+                    self._pos = 0
+                self._last_random = int.from_bytes(self._pool[self._pos:self._pos + 10], "big")
+                self._pos += 10
+                self._last_ms = now_ms
+            value = (now_ms << 80) | self._last_random
+        return "".join(self._ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+_task_ids = _TaskIdGenerator()
+
+
+def _to_timestamp(value) -> Optional[float]:
+    """Convert a datetime or epoch value to an epoch float."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _from_timestamp(value: Optional[float]) -> Optional[datetime]:
+    """Convert a stored epoch float back to a datetime."""
+    return datetime.fromtimestamp(value) if value is not None else None
+
 
 class TaskManager:
     """Manages asynchronous tasks and their execution."""
     
-    def __init__(self, max_workers: int = 4):
+    def __init__(self, max_workers: int = 4, db_path: Optional[str] = None):
         """Initialize task manager."""
-        self.tasks: Dict[str, TaskInfo] = {}
+        self.tasks: "OrderedDict[str, TaskInfo]" = OrderedDict()
+        self._last_persisted: Dict[str, float] = {}
+        # task_id -> the task's JSON, encoded at most once per change
+        self._task_json: Dict[str, bytes] = {}
+        # Encoded (task_id, task summary JSON) pairs for listings, rebuilt after a
+        # change. Readers take the reference without the lock; writers only ever
+        # swap it. The version counts changes, so a snapshot built while a task
+        # changed is not kept.
+        self._snapshot: Optional[Tuple[Tuple[bytes, bytes], ...]] = None
+        self._snapshot_version = 0
+        # task_id -> events of streaming clients, with the loop that owns each
+        self._watchers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        # (completed_at timestamp, task_id) of finished cached tasks, oldest first,
+        # so cleanup only visits expired tasks. Entries of tasks evicted since are
+        # dropped when they reach the head.
+        self._completed_heap: List[Tuple[float, str]] = []
+        # task_id -> completed_at timestamp of its heap entry, so a task
+        # reloaded into the cache is not pushed twice
+        self._completion_tracked: Dict[str, float] = {}
+        # Number of cached finished tasks holding a result, kept in step with
+        # the cache so eviction needs no pass over it
+        self._cached_results = 0
+        # task_id -> latest row queued on the writer thread and not yet written.
+        # An evicted task is read from here until its row lands, so a reload
+        # never sees an older state than the one it was evicted in.
+        self._pending_rows: Dict[str, tuple] = {}
+        self._pending_lock = Lock()
+        # task_lock guards the shared caches and indexes; updates to a single
+        # task's fields take only that task's stripe of _task_locks, so progress
+        # from different tasks is applied concurrently. Never take task_lock
+        # while holding a stripe.
         self.task_lock = Lock()
+        self._task_locks = tuple(Lock() for _ in range(TASK_LOCK_STRIPES))
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
         self.running = True
+        
+        # A single writer thread owns every SQLite write, so status updates
+        # issued from the event loop never wait on disk.
+        self._db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-db")
+        self._db = self._open_db(db_path or settings.task_db_path)
+        if self._db is not None:
+            self._load_tasks()
+        
         logger.info(f"Task manager initialized with {max_workers} workers")
     
+    def _open_db(self, db_path: str) -> Optional[sqlite3.Connection]:
+        """Open the task database in WAL mode, or return None to run in memory only."""
+        try:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_TASKS_SCHEMA)
+            conn.execute(_TASK_SUMMARIES_INDEX)
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            logger.warning(f"Task database unavailable at {db_path}, tasks will not persist: {e}")
+            return None
+    
+    def _load_tasks(self):
+        """Fail tasks interrupted by a restart; finished tasks are loaded on demand."""
+        cursor = self._db.execute(
+            "UPDATE tasks SET status = ?, error = ?, completed_at = ? WHERE status NOT IN (?, ?, ?)",
+            (
+                TaskStatus.FAILED.value,
+                "Task interrupted by server restart",
+                time.time(),
+                *(status.value for status in TERMINAL_STATUSES)
+            )
+        )
+        self._db.commit()
+        if cursor.rowcount:
+            logger.info(f"Marked {cursor.rowcount} interrupted tasks as failed")
+    
+    def _row_to_task(self, row: tuple, result_encoded: bool = True) -> TaskInfo:
+        """Build a TaskInfo from a persisted tasks row, or from a queued row whose result is not encoded yet."""
+        task_id, status, progress, result, error, started_at, completed_at = row
+        if result_encoded and result is not None:
+            result = orjson.loads(result)
+        return TaskInfo(
+            task_id=task_id,
+            status=status,
+            progress=progress,
+            result=result,
+            error=error,
+            started_at=_from_timestamp(started_at),
+            completed_at=_from_timestamp(completed_at)
+        )
+    
+    def _fetch_task(self, task_id: str) -> Optional[TaskInfo]:
+        """Load a single persisted task. Caller must hold task_lock."""
+        if self._db is None:
+            return None
+        pending = self._pending_rows.get(task_id)
+        if pending is not None:
+            task = self._row_to_task(pending, result_encoded=False)
+        else:
+            try:
+                row = self._db.execute(_SELECT_TASKS + " WHERE id = ?", (task_id,)).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to load task {task_id}: {e}")
+                return None
+            if row is None:
+                return None
+            task = self._row_to_task(row)
+        self._remember(task)
+        return task
+    
+    def _pending_summaries(self) -> Dict[str, tuple]:
+        """Queued rows not yet written, shaped like _SELECT_TASK_SUMMARIES rows."""
+        with self._pending_lock:
+            pending = list(self._pending_rows.values())
+        return {row[0]: row[:3] + (None,) + row[4:] for row in pending}
+    
+    @staticmethod
+    def _holds_result(task: TaskInfo) -> bool:
+        """Whether a task counts against MAX_CACHED_RESULTS."""
+        return task.status in TERMINAL_STATUSES and task.result is not None
+    
+    def _remember(self, task: TaskInfo):
+        """Cache a task in memory, evicting the oldest finished tasks over the caps. Caller must hold task_lock."""
+        replaced = self.tasks.get(task.task_id)
+        if replaced is not None and self._holds_result(replaced):
+            self._cached_results -= 1
+        if self._holds_result(task):
+            self._cached_results += 1
+        self.tasks[task.task_id] = task
+        self._task_json.pop(task.task_id, None)
+        self._drop_snapshot()
+        if task.status in TERMINAL_STATUSES and task.completed_at:
+            self._track_completion(task)
+        self._evict()
+    
+    def _track_completion(self, task: TaskInfo):
+        """Index a finished task by completion time for cleanup. Caller must hold task_lock."""
+        completed_at = _to_timestamp(task.completed_at)
+        if self._completion_tracked.get(task.task_id) == completed_at:
+            return
+        self._completion_tracked[task.task_id] = completed_at
+        heapq.heappush(self._completed_heap, (completed_at, task.task_id))
+    
+    def _evict(self):
+        """Evict the oldest finished tasks over MAX_CACHED_TASKS or MAX_CACHED_RESULTS. Caller must hold task_lock."""
+        excess_tasks = len(self.tasks) - MAX_CACHED_TASKS
+        excess_results = 0
+        if self._db is not None:
+            excess_results = self._cached_results - MAX_CACHED_RESULTS
+        if excess_tasks <= 0 and excess_results <= 0:
+            return
+        evictable = []
+        for task_id, cached in self.tasks.items():
+            if cached.status not in TERMINAL_STATUSES:
+                continue
+            if excess_tasks > 0 or (excess_results > 0 and cached.result is not None):
+                evictable.append(task_id)
+                excess_tasks -= 1
+                if cached.result is not None:
+                    excess_results -= 1
+                if excess_tasks <= 0 and excess_results <= 0:
+                    break
+        for task_id in evictable:
+            self._uncache(task_id)
+    
+    def _uncache(self, task_id: str):
+        """Remove a task from the in-memory cache. Caller must hold task_lock."""
+        task = self.tasks.pop(task_id)
+        if self._holds_result(task):
+            self._cached_results -= 1
+        self._task_json.pop(task_id, None)
+    
+    def _lock_for(self, task_id: str) -> Lock:
+        """The stripe of _task_locks that serializes updates to a task."""
+        return self._task_locks[hash(task_id) % TASK_LOCK_STRIPES]
+    
+    def _invalidate(self, task_id: str):
+        """Drop a changed task's cached encodings and wake its watchers. Caller must hold task_lock."""
+        self._task_json.pop(task_id, None)
+        self._drop_snapshot()
+        self._notify(task_id)
+    
+    def _drop_snapshot(self):
+        """Discard the listing snapshot after a change. Caller must hold task_lock."""
+        self._snapshot = None
+        self._snapshot_version += 1
+    
+    def _persist(self, task: TaskInfo):
+        """Queue an upsert of the task's current state on the writer thread."""
+        if self._db is None:
+            return
+        row = (
+            task.task_id,
+            TaskStatus(task.status).value,
+            task.progress,
+            task.result,
+            task.error,
+            _to_timestamp(task.started_at),
+            _to_timestamp(task.completed_at)
+        )
+        with self._pending_lock:
+            self._pending_rows[task.task_id] = row
+        self._db_writer.submit(self._write_row, row)
+    
+    def _write_row(self, row: tuple):
+        """Write a task row. Runs on the database writer thread."""
+        task_id, status, progress, result, error, started_at, completed_at = row
+        try:
+            result_json = orjson.dumps(result, default=str, option=_ORJSON_OPTIONS) if result is not None else None
+            self._db.execute(_UPSERT_TASK, (task_id, status, progress, result_json, error, started_at, completed_at))
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"Failed to persist task {task_id}: {e}")
+        finally:
+            # A newer row queued meanwhile stays pending until it is written too
+            with self._pending_lock:
+                if self._pending_rows.get(task_id) is row:
+                    del self._pending_rows[task_id]
+    
+    def _delete_expired_rows(self, cutoff: float):
+        """Delete finished task rows completed before cutoff. Runs on the database writer thread."""
+        try:
+            deleted = self._db.execute(
+                "DELETE FROM tasks WHERE completed_at < ? AND status IN (?, ?, ?)",
+                (cutoff, *(status.value for status in TERMINAL_STATUSES))
+            ).rowcount
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"Failed to delete persisted tasks: {e}")
+            return
+        if deleted:
+            with self.task_lock:
+                self._drop_snapshot()
+    
     def create_task(self, task_type: str, **kwargs) -> str:
         """Create a new task."""
-        task_id = str(uuid.uuid4())
+        task_id = _task_ids.new_id()
         
         with self.task_lock:
-            self.tasks[task_id] = TaskInfo(
+            task = TaskInfo(
                 task_id=task_id,
                 status=TaskStatus.PENDING,
                 progress=0.0,
@@ -40,39 +381,215 @@ class TaskManager:
                 started_at=None,
                 completed_at=None
             )
+            # Queued before the task is visible to update_task_status
+            self._persist(task)
+            self._remember(task)
         
         logger.info(f"Created task {task_id} of type {task_type}")
         return task_id
     
     def update_task_status(self, task_id: str, status: TaskStatus, **kwargs):
-        """Update task status."""
+        """Update task status.
+        
+        The in-memory task always reflects the update. Progress ticks within
+        an unchanged status are only persisted every PROGRESS_PERSIST_INTERVAL
+        seconds; status changes and results are persisted immediately.
+        """
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        
+        with self._lock_for(task_id):
+            held_result = self._holds_result(task)
+            status_changed = task.status != status
+            task.status = status
+            
+            if 'progress' in kwargs:
+                task.progress = kwargs['progress']
+            if 'result' in kwargs:
+                task.result = kwargs['result']
+            if 'error' in kwargs:
+                task.error = kwargs['error']
+            if status == TaskStatus.RUNNING and not task.started_at:
+                task.started_at = datetime.now()
+            elif status in TERMINAL_STATUSES:
+                task.completed_at = datetime.now()
+            
+            now = time.monotonic()
+            if (status_changed
+                or status in TERMINAL_STATUSES
+                or 'result' in kwargs
+                or 'error' in kwargs
+                or now - self._last_persisted.get(task_id, 0.0) >= PROGRESS_PERSIST_INTERVAL):
+                if status in TERMINAL_STATUSES:
+                    self._last_persisted.pop(task_id, None)
+                else:
+                    self._last_persisted[task_id] = now
+                self._persist(task)
+            holds_result = self._holds_result(task)
+        
+        # Invalidated after the fields change, so an encoding made concurrently
+        # under task_lock is never left cached
+        with self.task_lock:
+            # An eviction in between already counted the task as it is now
+            if holds_result != held_result and self.tasks.get(task_id) is task:
+                self._cached_results += 1 if holds_result else -1
+            self._invalidate(task_id)
+            if status in TERMINAL_STATUSES:
+                self._track_completion(task)
+                if task.result is not None:
+                    self._evict()
+        # Logged on every progress tick; %s arguments are only formatted when
+        # a handler takes DEBUG records
+        logger.debug("Updated task %s: %s (progress: %s)", task_id, status, task.progress)
+    
+    def watch(self, task_id: str) -> asyncio.Event:
+        """Register for updates to a task. Must be called from the event loop."""
+        event = asyncio.Event()
+        with self.task_lock:
+            self._watchers.setdefault(task_id, []).append((asyncio.get_running_loop(), event))
+        return event
+    
+    def unwatch(self, task_id: str, event: asyncio.Event):
+        """Remove an event registered with watch."""
         with self.task_lock:
-            if task_id in self.tasks:
-                task = self.tasks[task_id]
-                task.status = status
-                
-                if 'progress' in kwargs:
-                    task.progress = kwargs['progress']
-                if 'result' in kwargs:
-                    task.result = kwargs['result']
-                if 'error' in kwargs:
-                    task.error = kwargs['error']
-                if status == TaskStatus.RUNNING and not task.started_at:
-                    task.started_at = datetime.now()
-                elif status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
-                    task.completed_at = datetime.now()
-                
-                logger.info(f"Updated task {task_id}: {status} (progress: {task.progress})")
+            watchers = self._watchers.get(task_id, [])
+            self._watchers[task_id] = [(loop, e) for loop, e in watchers if e is not event]
+            if not self._watchers[task_id]:
+                del self._watchers[task_id]
+    
+    def _notify(self, task_id: str):
+        """Wake streaming clients of a task. Caller must hold task_lock; safe from any thread.
+        
+        Watchers whose event loop has closed, e.g. during shutdown, are
+        dropped rather than failing the update that notified them.
+        """
+        watchers = self._watchers.get(task_id)
+        if not watchers:
+            return
+        live = []
+        for loop, event in watchers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                continue
+            live.append((loop, event))
+        if len(live) != len(watchers):
+            if live:
+                self._watchers[task_id] = live
+            else:
+                del self._watchers[task_id]
+    
+    def peek_task(self, task_id: str) -> Optional[TaskInfo]:
+        """Get a task if it is cached, without blocking."""
+        return self.tasks.get(task_id)
     
     def get_task(self, task_id: str) -> Optional[TaskInfo]:
-        """Get task information."""
+        """Get task information.
+        
+        Cached tasks are read without task_lock: a single dict lookup is
+        atomic, and writers only take the lock to keep their own updates
+        consistent. Only tasks that must be loaded from the database lock,
+        and may block: on the event loop, try peek_task first.
+        """
+        task = self.tasks.get(task_id)
+        if task is not None:
+            return task
+        with self.task_lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                task = self._fetch_task(task_id)
+            return task
+    
+    def _encode_task(self, task: TaskInfo) -> bytes:
+        """Get a cached task's JSON, encoding it on first use since its last change. Caller must hold task_lock."""
+        encoded = self._task_json.get(task.task_id)
+        if encoded is None:
+            encoded = task.model_dump_json().encode()
+            self._task_json[task.task_id] = encoded
+        return encoded
+    
+    def peek_task_json(self, task_id: str) -> Optional[bytes]:
+        """Get a task's cached encoding if it is current, without blocking."""
+        return self._task_json.get(task_id)
+    
+    def get_task_json(self, task_id: str) -> Optional[bytes]:
+        """Get a task as encoded JSON.
+        
+        Polling an unchanged task returns the same bytes without walking its
+        result again; the encoding is dropped whenever the task is updated.
+        Like get_task, the cached bytes are read without task_lock; encoding
+        or loading a task may block, so try peek_task_json first on the
+        event loop.
+        """
+        encoded = self._task_json.get(task_id)
+        if encoded is not None:
+            return encoded
         with self.task_lock:
-            return self.tasks.get(task_id)
+            task = self.tasks.get(task_id)
+            if task is None:
+                task = self._fetch_task(task_id)
+                if task is None:
+                    return None
+            return self._encode_task(task)
     
     def get_all_tasks(self) -> Dict[str, TaskInfo]:
-        """Get all tasks."""
+        """Get all tasks.
+        
+        Persisted-only tasks are returned without their results and without
+        being cached; get_task loads a task's result. The database is read
+        outside task_lock.
+        """
         with self.task_lock:
-            return self.tasks.copy()
+            tasks = dict(self.tasks)
+        if self._db is not None:
+            pending = self._pending_summaries()
+            for row in self._db.execute(_SELECT_TASK_SUMMARIES):
+                if row[0] not in tasks:
+                    tasks[row[0]] = self._row_to_task(pending.pop(row[0], row))
+            for task_id, row in pending.items():
+                if task_id not in tasks:
+                    tasks[task_id] = self._row_to_task(row)
+        return tasks
+    
+    def peek_tasks_snapshot(self) -> Optional[Tuple[Tuple[bytes, bytes], ...]]:
+        """Get the current listing snapshot if no task changed since it was built, without blocking."""
+        return self._snapshot
+    
+    def get_tasks_snapshot(self) -> Tuple[Tuple[bytes, bytes], ...]:
+        """Get every task as encoded (task_id, task summary JSON) pairs.
+        
+        Listings carry each task's status and timestamps with a null result;
+        results are fetched per task. The snapshot is rebuilt only after a
+        task changes; between changes it is returned without taking
+        task_lock. A rebuild reads the database and encodes the summaries
+        outside task_lock, so it never holds up progress updates, and may
+        block: call it off the event loop.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self.task_lock:
+            version = self._snapshot_version
+            tasks = list(self.tasks.values())
+        
+        entries = [
+            (orjson.dumps(task.task_id), task.model_copy(update={"result": None}).model_dump_json().encode())
+            for task in tasks
+        ]
+        if self._db is not None:
+            cached_ids = {task.task_id for task in tasks}
+            pending = self._pending_summaries()
+            rows = [pending.pop(row[0], row) for row in self._db.execute(_SELECT_TASK_SUMMARIES)]
+            for row in rows + list(pending.values()):
+                if row[0] not in cached_ids:
+                    entries.append((orjson.dumps(row[0]), self._row_to_task(row).model_dump_json().encode()))
+        snapshot = tuple(entries)
+        
+        with self.task_lock:
+            if self._snapshot_version == version:
+                self._snapshot = snapshot
+        return snapshot
     
     async def execute_task(self, task_id: str, func: Callable, *args, **kwargs):
         """Execute a task asynchronously."""
@@ -94,37 +611,65 @@ class TaskManager:
     
     def cancel_task(self, task_id: str) -> bool:
         """Cancel a task."""
+        task = self.tasks.get(task_id)
+        if task is None:
+            return False
+        
+        with self._lock_for(task_id):
+            if task.status not in [TaskStatus.PENDING, TaskStatus.RUNNING]:
+                return False
+            task.status = TaskStatus.CANCELLED
+            task.completed_at = datetime.now()
+            self._persist(task)
+        
         with self.task_lock:
-            if task_id in self.tasks:
-                task = self.tasks[task_id]
-                if task.status in [TaskStatus.PENDING, TaskStatus.RUNNING]:
-                    task.status = TaskStatus.CANCELLED
-                    task.completed_at = time.time()
-                    logger.info(f"Task {task_id} cancelled")
-                    return True
-        return False
+            self._invalidate(task_id)
+            self._track_completion(task)
+        logger.info(f"Task {task_id} cancelled")
+        return True
     
     def cleanup_old_tasks(self, max_age_hours: int = 24):
-        """Clean up old completed tasks."""
+        """Clean up old completed tasks.
+        
+        Finished tasks are popped from the completion-time heap, so the work
+        under task_lock is proportional to the number of expired tasks rather
+        than to every cached task.
+        """
         current_time = time.time()
         max_age_seconds = max_age_hours * 3600
+        cutoff = current_time - max_age_seconds
         
         with self.task_lock:
-            tasks_to_remove = []
-            for task_id, task in self.tasks.items():
-                if (task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED] 
-                    and task.completed_at 
-                    and (current_time - task.completed_at) > max_age_seconds):
-                    tasks_to_remove.append(task_id)
+            heap = self._completed_heap
+            removed = False
+            while heap and heap[0][0] < cutoff:
+                completed_at, task_id = heapq.heappop(heap)
+                if self._completion_tracked.get(task_id) == completed_at:
+                    del self._completion_tracked[task_id]
+                task = self.tasks.get(task_id)
+                # Skip entries of evicted tasks and of tasks completed again since
+                if (task is None
+                    or task.status not in TERMINAL_STATUSES
+                    or not task.completed_at
+                    or _to_timestamp(task.completed_at) != completed_at):
+                    continue
+                self._uncache(task_id)
+                removed = True
+                logger.debug("Cleaned up old task: %s", task_id)
+            if removed:
+                self._drop_snapshot()
             
-            for task_id in tasks_to_remove:
-                del self.tasks[task_id]
-                logger.info(f"Cleaned up old task: {task_id}")
+            # Rows never loaded into memory are expired by age in the database
+            if self._db is not None:
+                self._db_writer.submit(self._delete_expired_rows, current_time - max_age_seconds)
     
     def shutdown(self):
         """Shutdown task manager."""
         self.running = False
         self.executor.shutdown(wait=True)
+        self._db_writer.shutdown(wait=True)
+        if self._db is not None:
+            self._db.close()
         logger.info("Task manager shutdown complete")
 
 
@@ -0,0 +1,88 @@
+"""
+Tests for API response compression.
+"""
+import asyncio
+
+import pytest
+
+from utils.compression import APIGZipMiddleware
+
+
+def _event_stream_app(finished: asyncio.Event):
+    """ASGI app that sends one event, then holds the stream open until finished is set."""
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream")],
+        })
+        await send({"type": "http.response.body", "body": b"data: first\n\n" * 64, "more_body": True})
+        await finished.wait()
+        await send({"type": "http.response.body", "body": b"data: last\n\n", "more_body": False})
+    return app
+
+
+def _scope(path: str):
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": [(b"accept-encoding", b"gzip, deflate")],
+    }
+
+
+async def _first_event_before_finish(path: str):
+    finished = asyncio.Event()
+    middleware = APIGZipMiddleware(_event_stream_app(finished), minimum_size=16)
+    messages = asyncio.Queue()
+    
+    async def receive():
+        await asyncio.Event().wait()
+    
+    run = asyncio.create_task(middleware(_scope(path), receive, messages.put))
+    try:
+        start = await asyncio.wait_for(messages.get(), timeout=1)
+        body = await asyncio.wait_for(messages.get(), timeout=1)
+    finally:
+        finished.set()
+        await asyncio.wait_for(run, timeout=1)
+    return start, body
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/ai/tasks/abc/stream",
+    # Recognized by content type even outside the /stream path
+    "/api/v1/ai/tasks/abc/events",
+])
+def test_event_stream_is_not_buffered_by_gzip(path):
+    start, body = asyncio.run(_first_event_before_finish(path))
+    
+    assert start["type"] == "http.response.start"
+    assert b"content-encoding" not in dict(start["headers"])
+    assert body["body"].startswith(b"data: first\n\n")
+    assert body["more_body"] is True
+
+
+def test_json_is_still_compressed():
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": b"[" + b"0," * 1024 + b"0]"})
+    
+    async def run():
+        messages = []
+        
+        async def send(message):
+            messages.append(message)
+        
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        await APIGZipMiddleware(app, minimum_size=16)(_scope("/api/v1/ai/tasks"), receive, send)
+        return messages
+    
+    start = asyncio.run(run())[0]
+    assert dict(start["headers"])[b"content-encoding"] == b"gzip"
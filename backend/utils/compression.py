@@ -0,0 +1,49 @@
+"""
+Response compression for the API.
+"""
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
+
+
+class _EventStreamGZipResponder(GZipResponder):
+    """GZipResponder that passes server-sent event streams through uncompressed.
+    
+    Streamed bodies are written to the GzipFile without a flush, so each
+    event would sit in zlib's buffer until the stream ended.
+    """
+    
+    passthrough = False
+    
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            self.passthrough = content_type.startswith("text/event-stream")
+        if self.passthrough:
+            await self.send(message)
+            return
+        await super().send_with_gzip(message)
+
+
+class APIGZipMiddleware(GZipMiddleware):
+    """GZip middleware that leaves already-compressed media and event streams untouched."""
+    
+    # Video and image files are already compressed, and gzipping them
+    # would break byte-range requests from the video player. Event streams
+    # must not be buffered by the compressor; they are also recognized by
+    # content type, for streams served under other paths.
+    UNCOMPRESSED_PREFIXES = ("/static/", "/video/")
+    UNCOMPRESSED_SUFFIXES = ("/stream",)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (
+            scope["path"].startswith(self.UNCOMPRESSED_PREFIXES)
+            or scope["path"].endswith(self.UNCOMPRESSED_SUFFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+        if "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _EventStreamGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
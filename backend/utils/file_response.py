@@ -0,0 +1,202 @@
+"""
+File responses with HTTP byte-range and zero-copy support for video serving.
+"""
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import anyio
+import anyio.to_thread
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from utils.responses import etag_matches
+
+
+def file_validators(stat_result: os.stat_result) -> Dict[str, str]:
+    """Build the ETag and Last-Modified headers for a stat'ed file."""
+    return {
+        "etag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+
+def is_not_modified(request_headers: Mapping[str, str], validators: Dict[str, str], mtime: float) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since against a file's validators.
+
+    Args:
+        request_headers: Incoming request headers
+        validators: Headers from file_validators
+        mtime: File modification time in seconds
+
+    Returns:
+        True if the client's cached copy is current and a 304 can be sent
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 7232 3.3)
+        return etag_matches(if_none_match, validators["etag"])
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def parse_byte_range(
+    range_header: str,
+    file_size: int,
+    max_length: Optional[int] = None
+) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-part ``Range: bytes=...`` header.
+
+    Args:
+        range_header: Raw Range header value
+        file_size: Size of the file being served
+        max_length: Cap on the span served for open-ended ``start-`` ranges
+
+    Returns:
+        Inclusive (start, end) offsets, or None if the header should be
+        ignored and the whole file served (multi-part or malformed ranges)
+
+    Raises:
+        ValueError: If the range cannot be satisfied for this file size
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep or not (start_text or end_text):
+        return None
+    if (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+
+    last = file_size - 1
+    if not start_text:
+        # Suffix range: the final N bytes
+        suffix = int(end_text)
+        if suffix == 0 or file_size == 0:
+            raise ValueError(f"Unsatisfiable range: {range_header}")
+        return max(file_size - suffix, 0), last
+
+    start = int(start_text)
+    if end_text:
+        end = int(end_text)
+    elif max_length:
+        end = start + max_length - 1
+    else:
+        end = last
+    if start >= file_size:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    if end < start:
+        return None
+    return start, min(end, last)
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that answers Range requests with 206 Partial Content.
+
+    When the ASGI server offers the ``http.response.zerocopysend`` extension
+    the body is sent with sendfile(2) instead of being copied through Python.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        range_header: Optional[str],
+        stat_result: os.stat_result,
+        max_range_bytes: Optional[int] = None,
+        raw_headers: Sequence[Tuple[bytes, bytes]] = (),
+        **kwargs
+    ):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        # Pre-encoded, lower-cased header pairs skip Starlette's per-request encoding
+        self.raw_headers.extend(raw_headers)
+        self.headers["accept-ranges"] = "bytes"
+        self.byte_range: Optional[Tuple[int, int]] = None
+
+        if not range_header:
+            return
+
+        file_size = stat_result.st_size
+        try:
+            self.byte_range = parse_byte_range(range_header, file_size, max_range_bytes)
+        except ValueError:
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{file_size}"
+            self.headers["content-length"] = "0"
+            return
+
+        if self.byte_range is not None:
+            start, end = self.byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers["content-length"] = str(stat_result.st_size)
+        self.headers.update(file_validators(stat_result))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+        if self.status_code == 200 and not zero_copy:
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if self.status_code == 416 or scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            start, end = self.byte_range or (0, self.stat_result.st_size - 1)
+            count = end - start + 1
+            if count <= 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif zero_copy:
+                await self._send_zero_copy(send, start, count)
+            else:
+                await self._send_chunks(send, start, count)
+
+        if self.background is not None:
+            await self.background()
+
+    async def _send_zero_copy(self, send: Send, offset: int, count: int) -> None:
+        """Hand the file to the server, which sendfile(2)s it straight to the socket."""
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": False,
+            })
+        finally:
+            file.close()
+
+    async def _send_chunks(self, send: Send, offset: int, count: int) -> None:
+        """Read the span in chunks for servers without the zero-copy extension."""
+        remaining = count
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(offset)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    # File shrank since it was stat'ed; end the body cleanly
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
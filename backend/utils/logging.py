@@ -1,8 +1,11 @@
 """
 Logging configuration for the Botco Data Platform.
 """
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
 import sys
 from pathlib import Path
 from config import settings
@@ -87,7 +90,15 @@ def setup_logging():
         }
     }
     
+    # No formatter uses thread, process or asyncio task names, so skip
+    # collecting them for every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+    
     logging.config.dictConfig(logging_config)
+    _queue_handlers(logging_config["loggers"])
     
     # Set up specific loggers
     logger = logging.getLogger("botco")
@@ -96,5 +107,41 @@ def setup_logging():
     return logger
 
 
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+    
+    The stock handler renders the message (and any %s arguments) in the
+    logging thread before enqueueing. Records never leave the process here,
+    so they are passed through as-is and formatted by the target handler.
+    """
+    
+    def prepare(self, record):
+        return record
+
+
+def _queue_handlers(logger_names):
+    """Move handler writes onto background listener threads.
+    
+    Task status updates log from the event loop, so each record would
+    otherwise block on synchronous writes to stdout and the rotating log files.
+    """
+    queued = {}
+    for name in logger_names:
+        target = logging.getLogger(name)
+        for handler in list(target.handlers):
+            if handler not in queued:
+                record_queue = queue.SimpleQueue()
+                queue_handler = _DeferredQueueHandler(record_queue)
+                queue_handler.setLevel(handler.level)
+                listener = logging.handlers.QueueListener(record_queue, handler, respect_handler_level=True)
+                listener.start()
+                queued[handler] = (queue_handler, listener)
+            target.removeHandler(handler)
+            target.addHandler(queued[handler][0])
+    
+    for _, listener in queued.values():
+        atexit.register(listener.stop)
+
+
 # Initialize logging
 logger = setup_logging()
@@ -0,0 +1,160 @@
+"""
+Run-length encoding for segmentation masks.
+
+Masks use COCO's uncompressed RLE layout: ``size`` is ``[height, width]`` and
+``counts`` holds alternating run lengths of 0s and 1s over the mask in
+column-major order, always starting with a (possibly empty) run of 0s.
+"""
+from typing import Any, Dict, List, Mapping, Tuple, Union
+
+import numpy as np
+
+
+def _as_bool_mask(mask: Any) -> np.ndarray:
+    """Convert a NumPy array, torch tensor (on any device) or nested list to a 2D bool array."""
+    if hasattr(mask, "detach"):
+        mask = mask.detach().cpu().numpy()
+    mask = np.squeeze(np.asarray(mask))
+    if mask.dtype != bool:
+        mask = mask > 0
+    return mask
+
+
+def encode_rle(mask: Any) -> Dict[str, List[int]]:
+    """
+    Encode a 2D mask as uncompressed COCO RLE.
+
+    Args:
+        mask: Boolean mask, or scores/logits where values > 0 are foreground;
+            a NumPy array, torch tensor (on any device) or nested list
+
+    Returns:
+        Dict with ``size`` and ``counts`` lists
+    """
+    return _encode_bool_rle(_as_bool_mask(mask))
+
+
+def _encode_bool_rle(mask: np.ndarray) -> Dict[str, List[int]]:
+    """Encode a 2D bool array as uncompressed COCO RLE."""
+    height, width = mask.shape
+    return {"size": [height, width], "counts": _bool_rle_counts(mask).tolist()}
+
+
+def _bool_rle_counts(mask: np.ndarray) -> np.ndarray:
+    """Column-major run lengths of a 2D bool array, starting with a run of 0s."""
+    flat = mask.ravel(order="F")
+    if flat.size == 0:
+        return np.zeros(1, dtype=np.int64)
+
+    boundaries = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], boundaries, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return counts
+
+
+def _rle_bbox(counts: np.ndarray, height: int) -> List[float]:
+    """[x, y, width, height] of the foreground from column-major RLE counts, or zeros if empty."""
+    runs = len(counts) // 2
+    if runs == 0:
+        return [0.0, 0.0, 0.0, 0.0]
+    # Flat column-major [start, end) of every run of 1s
+    edges = np.cumsum(counts)
+    starts = edges[0:2 * runs:2]
+    ends = edges[1:2 * runs:2]
+    first_cols = starts // height
+    last_cols = (ends - 1) // height
+    # A run that wraps into the next column covers the bottom of one column
+    # and the top of the next, so it spans every row
+    wraps = first_cols != last_cols
+    y_min = np.where(wraps, 0, starts % height).min()
+    y_max = np.where(wraps, height - 1, (ends - 1) % height).max()
+    x_min = first_cols[0]
+    x_max = last_cols[-1]
+    return [float(x_min), float(y_min), float(x_max - x_min + 1), float(y_max - y_min + 1)]
+
+
+def summarize_mask(mask: Any) -> Tuple[Dict[str, List[int]], int, List[float]]:
+    """
+    Encode a mask and measure it from a single bool conversion.
+
+    The area and bounding box are derived from the RLE's runs rather than by
+    further passes over the pixels.
+
+    Args:
+        mask: Anything accepted by encode_rle
+
+    Returns:
+        (rle, area, [x, y, width, height] bounding box)
+    """
+    mask = _as_bool_mask(mask)
+    height, width = mask.shape
+    counts = _bool_rle_counts(mask)
+    rle = {"size": [height, width], "counts": counts.tolist()}
+    return rle, int(counts[1::2].sum()), _rle_bbox(counts, height)
+
+
+def _rle_fields(rle: Union[Mapping[str, Any], Any]) -> Tuple[List[int], Any]:
+    """(size, counts) of an RLE dict or of an object with those attributes."""
+    if isinstance(rle, Mapping):
+        return rle["size"], rle["counts"]
+    return rle.size, rle.counts
+
+
+def rle_bbox(rle: Union[Mapping[str, Any], Any]) -> List[float]:
+    """
+    Bounding box of an RLE mask's foreground, computed from its runs without decoding.
+
+    Args:
+        rle: Dict with ``size`` and ``counts``, or an object with those attributes
+
+    Returns:
+        [x, y, width, height], or zeros if the mask is empty
+    """
+    size, counts = _rle_fields(rle)
+    return _rle_bbox(np.asarray(counts), size[0])
+
+
+def decode_rle(rle: Union[Mapping[str, Any], Any]) -> np.ndarray:
+    """
+    Decode uncompressed COCO RLE back to a mask.
+
+    Args:
+        rle: Dict with ``size`` and ``counts``, or an object with those attributes
+
+    Returns:
+        uint8 array of shape (height, width) with 1 for foreground
+    """
+    size, counts = _rle_fields(rle)
+    height, width = size
+    values = (np.arange(len(counts)) % 2).astype(np.uint8)
+    flat = np.repeat(values, counts)
+    return flat.reshape((height, width), order="F")
+
+
+def decode_rle_box(rle: Union[Mapping[str, Any], Any], box: List[float]) -> np.ndarray:
+    """
+    Decode only a box of an RLE mask.
+
+    Runs are clipped to the box's columns before expanding, so the work
+    scales with the box's width rather than the whole mask.
+
+    Args:
+        rle: Dict with ``size`` and ``counts``, or an object with those attributes
+        box: [x, y, width, height] inside the mask, e.g. from rle_bbox
+
+    Returns:
+        uint8 array of shape (box height, box width) with 1 for foreground
+    """
+    size, counts = _rle_fields(rle)
+    height = size[0]
+    x, y, width, box_height = (int(v) for v in box)
+    counts = np.asarray(counts)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    # Column-major, so the box's columns are one contiguous flat range
+    lo, hi = x * height, (x + width) * height
+    lengths = np.clip(ends, lo, hi) - np.clip(starts, lo, hi)
+    values = (np.arange(len(counts)) % 2).astype(np.uint8)
+    flat = np.repeat(values, lengths)
+    return flat.reshape((height, width), order="F")[y:y + box_height]
@@ -0,0 +1,49 @@
+"""
+Helpers for returning pre-encoded JSON responses.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+
+def payload_etag(body: bytes) -> str:
+    """Strong ETag for an encoded payload; compute once per cached payload."""
+    return f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header, which may list several (weak) tags, against an ETag."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def cached_json_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    cache_control: Optional[str] = None
+) -> Response:
+    """Return a pre-encoded JSON body, or 304 if the client already holds it."""
+    headers = {"ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """Encode a response model directly.
+    
+    Returning a Response keeps the route's response_model for the OpenAPI
+    schema while FastAPI skips re-validating and re-encoding the model.
+    """
+    return Response(content=model.model_dump_json(), status_code=status_code, media_type="application/json")
@@ -1,36 +1,68 @@
 import cv2
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+
+from utils.logging import logger
+
+# Opening a video to read its metadata is I/O-bound and OpenCV releases the
+# GIL while doing it, so batches of videos are probed concurrently
+_video_probe_pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="video-probe")
 
 def get_video_info(video_path: str):
     """
     Extract metadata from a video file using OpenCV
+
+    Results are cached per file version (mtime and size), so repeated scans
+    and processing tasks on the same video skip opening the container. Videos
+    that cannot be opened are cached as None too, and logged only once per version.
     """
     try:
-        cap = cv2.VideoCapture(video_path)
-        
+        stat_result = os.stat(video_path)
+        return _read_video_info(video_path, stat_result.st_mtime_ns, stat_result.st_size)
+
+    except Exception as e:
+        logger.error(f"Error reading video {video_path}: {e}")
+        return None
+
+
+def get_videos_info(video_paths: List[str]) -> List[Optional[dict]]:
+    """
+    Extract metadata from several video files at once
+
+    Videos are probed concurrently on a shared pool; results are in the
+    order of video_paths, with None for videos that could not be read.
+    """
+    if len(video_paths) <= 1:
+        return [get_video_info(video_path) for video_path in video_paths]
+    return list(_video_probe_pool.map(get_video_info, video_paths))
+
+
+@lru_cache(maxsize=1024)
+def _read_video_info(video_path: str, mtime_ns: int, size: int):
+    """Open a video once and read its properties, or return None if it cannot be opened."""
+    cap = cv2.VideoCapture(video_path)
+    try:
         if not cap.isOpened():
-            print(f"Error: Could not open video file {video_path}")
+            logger.error(f"Error reading video {video_path}: could not open video file")
             return None
-        
+
         # Get video properties
         frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         fps = cap.get(cv2.CAP_PROP_FPS)
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        # Calculate duration
-        duration = frame_count / fps if fps > 0 else 0
-        
+    finally:
         cap.release()
-        
-        return {
-            'frame_count': frame_count,
-            'fps': fps,
-            'width': width,
-            'height': height,
-            'duration': duration
-        }
-        
-    except Exception as e:
-        print(f"Error reading video {video_path}: {e}")
-        return None
+
+    # Calculate duration
+    duration = frame_count / fps if fps > 0 else 0
+
+    return {
+        'frame_count': frame_count,
+        'fps': fps,
+        'width': width,
+        'height': height,
+        'duration': duration
+    }